@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+from init_db import migrate
+from utils.dag import DAG
+from utils.traversal import postorder
+from utils.tree import dumps_deep, fetch_topic_forest
+
+# 树遍历基准：合成一条很深的知识点链和一个很宽的知识点层，
+# 对比显式栈实现与原来的递归实现（递归版超出深度上限时记为失败）；
+# 另外单独测触发器维护 TopicClosure 的开销，它随深度平方增长。
+# 用法：python bench_traversal.py [--depth 10000] [--width 100000] [--closure-depth 1000]
+
+
+def build_db(path: str, depth: int, width: int):
+    """一个考试、两个科目：科目 1 是 depth 层的单链，科目 2 是 width 个并列的顶层知识点；叶子各带一份笔记。"""
+    with sqlite3.connect(path) as conn:
+        migrate(conn)
+        # 闭包表每个知识点要为每个祖先存一行，深链的插入和存储都是 O(节点数 × 深度)（1 万层约 5000 万行）；
+        # 这里只测遍历，临时库里去掉维护它的触发器，闭包表的开销由 closure_cost 单独测
+        conn.execute("DROP TRIGGER trg_topic_closure_insert")
+        conn.execute("INSERT INTO Exam (exam_id, exam_name) VALUES (1, 'bench')")
+        conn.execute("INSERT INTO Subject (subject_id, exam_id, subject_name) VALUES (1, 1, 'deep'), (2, 1, 'wide')")
+        conn.executemany(
+            "INSERT INTO TopicNode (topic_id, subject_id, parent_id, name, importance, is_leaf) VALUES (?, 1, ?, ?, 5, ?)",
+            ((i, i - 1 if i > 1 else None, f"d{i}", i == depth) for i in range(1, depth + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO TopicNode (topic_id, subject_id, parent_id, name, importance, is_leaf) VALUES (?, 2, NULL, ?, 5, 1)",
+            ((depth + i, f"w{i}") for i in range(1, width + 1)),
+        )
+        conn.execute(
+            """
+            INSERT INTO InputMaterial (topic_id, type, title, required_hours, reviewed_hours)
+            SELECT topic_id, 'note', name, 1, 0 FROM TopicNode WHERE is_leaf = 1
+        """
+        )
+        conn.commit()
+
+
+def closure_cost(depth: int):
+    """逐个插入 depth 层的单链（触发器照常维护闭包表），再把整条链挂到另一个顶层知识点下。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        with sqlite3.connect(os.path.join(tmp, "closure.db")) as conn:
+            migrate(conn)
+            conn.execute("INSERT INTO Exam (exam_id, exam_name) VALUES (1, 'bench')")
+            conn.execute("INSERT INTO Subject (subject_id, exam_id, subject_name) VALUES (1, 1, 'chain')")
+            root = depth + 1
+            conn.execute(
+                "INSERT INTO TopicNode (topic_id, subject_id, parent_id, name, importance, is_leaf) VALUES (?, 1, NULL, 'root', 5, 0)",
+                (root,),
+            )
+            print(f"闭包表：{depth} 层单链")
+            timed("逐个插入", lambda: conn.executemany(
+                "INSERT INTO TopicNode (topic_id, subject_id, parent_id, name, importance, is_leaf) VALUES (?, 1, ?, ?, 5, ?)",
+                ((i, i - 1 if i > 1 else None, f"c{i}", i == depth) for i in range(1, depth + 1)),
+            ))
+            rows = conn.execute("SELECT COUNT(*) FROM TopicClosure").fetchone()[0]
+            print(f"  {'闭包表行数':<28} {rows:9d}")
+            timed("整条链移到 root 下", lambda: conn.execute("UPDATE TopicNode SET parent_id = ? WHERE topic_id = 1", (root,)))
+            conn.commit()
+
+
+# ───────────── 递归参照实现 ─────────────
+def recursive_counts(dag: DAG):
+    def visit(node):
+        for child in node.children:
+            visit(child)
+        node.unfinished_children_count = sum(1 for child in node.children if not child.is_completed)
+        DAG._sum_subtree(node)
+
+    for exam_node in dag.exam_nodes.values():
+        visit(exam_node)
+
+
+def recursive_first_task(node, types):
+    for material in node.inputs:
+        if not material.is_completed and material.type in types:
+            return material
+    for child in node.children:
+        result = recursive_first_task(child, types)
+        if result:
+            return result
+    return None
+
+
+def timed(label: str, fn, repeat: int = 1):
+    try:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"  {label:<28} {elapsed * 1000:9.1f} ms")
+    except RecursionError:
+        print(f"  {label:<28} {'RecursionError':>12}")
+
+
+def run(depth: int, width: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        build_db(path, depth, width)
+        print(f"深链 {depth} 层，宽层 {width} 个知识点")
+
+        dag = None
+
+        def load():
+            nonlocal dag
+            dag = DAG(path)
+
+        timed("DAG 加载", load)
+        deep, wide = dag.subject_nodes[1], dag.subject_nodes[2]
+        types = ("note",)
+
+        print("未完成计数与子树汇总")
+        timed("显式栈（后根遍历）", dag._update_aggregates, 5)
+        timed("递归", lambda: recursive_counts(dag), 5)
+
+        for name, subject in (("深链", deep), ("宽层", wide)):
+            print(f"第一个任务（{name}）")
+
+            def iterative():
+                dag._progress_generation += 1   # 让缓存失效，测完整遍历
+                dag._first_task(subject, types, None, (types, None))
+
+            timed("显式栈", iterative, 5)
+            timed("递归", lambda: recursive_first_task(subject, types), 5)
+
+        print("后根遍历整棵 DAG")
+        timed("postorder", lambda: sum(1 for _ in postorder(dag.exam_nodes.values(), lambda n: n.children)), 5)
+
+        with sqlite3.connect(path) as conn:
+            forest = fetch_topic_forest(conn)
+        print("知识点树 JSON（深链）")
+        timed("dumps_deep", lambda: dumps_deep(forest[1]), 3)
+        timed("json.dumps", lambda: json.dumps(forest[1], ensure_ascii=False), 3)
+        print("知识点树 JSON（宽层）")
+        timed("dumps_deep", lambda: dumps_deep(forest[2]), 3)
+        timed("json.dumps", lambda: json.dumps(forest[2], ensure_ascii=False), 3)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="树遍历基准")
+    parser.add_argument("--depth", type=int, default=10000)
+    parser.add_argument("--width", type=int, default=100000)
+    parser.add_argument("--closure-depth", type=int, default=1000, help="闭包表开销测试的链长，0 为跳过")
+    args = parser.parse_args()
+    run(args.depth, args.width)
+    if args.closure_depth:
+        closure_cost(args.closure_depth)
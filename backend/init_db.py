@@ -1,4 +1,9 @@
+import argparse
 import sqlite3
+import sys
+from typing import List, Tuple
+
+from utils.exp import BUCKET_SQL, DAILY_EXP_SQL
 
 DB_NAME = "review_plan.db"
 
@@ -81,13 +86,533 @@ CREATE TABLE IF NOT EXISTS SpecialSchedule (
 """
 
 
-def initialize_database():
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.executescript(schema)
-        conn.commit()
+
+def _output_exp_per_minute(alias: str) -> str:
+    """输出材料每分钟 EXP：完成且有准确率时为 (1/0.6) × accuracy / 60，否则为 0。"""
+    return (
+        f"(CASE WHEN {alias}.is_completed AND {alias}.accuracy IS NOT NULL "
+        f"THEN {alias}.accuracy / 0.6 / 60.0 ELSE 0 END)"
+    )
+
+
+def _log_exp_delta(row: str, sign: str) -> str:
+    """一条日志对 ExpLedger 的增量；既有输入又有输出的日志按输入计。"""
+    return f"""
+    UPDATE ExpLedger SET
+        input_minutes = input_minutes {sign} CASE
+            WHEN {row}.input_material_id IS NOT NULL
+            THEN COALESCE({row}.duration_minutes, 0) ELSE 0 END,
+        output_exp = output_exp {sign} CASE
+            WHEN {row}.input_material_id IS NULL AND {row}.output_material_id IS NOT NULL
+            THEN COALESCE({row}.duration_minutes, 0) * COALESCE((
+                SELECT {_output_exp_per_minute("o")} FROM OutputMaterial o
+                WHERE o.output_id = {row}.output_material_id
+            ), 0)
+            ELSE 0 END
+    WHERE id = 1;"""
+
+
+def _output_logged_minutes(row: str) -> str:
+    return f"""COALESCE((
+        SELECT SUM(duration_minutes) FROM ReviewTaskLog
+        WHERE output_material_id = {row}.output_id AND input_material_id IS NULL
+    ), 0)"""
+
+
+exp_ledger_schema = f"""
+CREATE TABLE IF NOT EXISTS ExpLedger (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    input_minutes INTEGER NOT NULL DEFAULT 0,
+    output_exp REAL NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_log_output ON ReviewTaskLog(
+    output_material_id, input_material_id, duration_minutes
+);
+
+INSERT OR REPLACE INTO ExpLedger (id, input_minutes, output_exp)
+SELECT 1,
+    COALESCE(SUM(CASE WHEN l.input_material_id IS NOT NULL
+        THEN COALESCE(l.duration_minutes, 0) END), 0),
+    COALESCE(SUM(CASE WHEN l.input_material_id IS NULL
+        THEN COALESCE(l.duration_minutes, 0) * {_output_exp_per_minute("o")} END), 0)
+FROM ReviewTaskLog l
+LEFT JOIN OutputMaterial o ON o.output_id = l.output_material_id;
+
+CREATE TRIGGER IF NOT EXISTS trg_exp_log_insert AFTER INSERT ON ReviewTaskLog
+BEGIN{_log_exp_delta("NEW", "+")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exp_log_delete AFTER DELETE ON ReviewTaskLog
+BEGIN{_log_exp_delta("OLD", "-")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exp_log_update AFTER UPDATE ON ReviewTaskLog
+BEGIN{_log_exp_delta("OLD", "-")}{_log_exp_delta("NEW", "+")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exp_output_insert AFTER INSERT ON OutputMaterial
+BEGIN
+    UPDATE ExpLedger SET output_exp = output_exp
+        + {_output_exp_per_minute("NEW")} * {_output_logged_minutes("NEW")}
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exp_output_update
+AFTER UPDATE OF accuracy, is_completed ON OutputMaterial
+BEGIN
+    UPDATE ExpLedger SET output_exp = output_exp
+        + ({_output_exp_per_minute("NEW")} - {_output_exp_per_minute("OLD")})
+        * {_output_logged_minutes("NEW")}
+    WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exp_output_delete AFTER DELETE ON OutputMaterial
+BEGIN
+    UPDATE ExpLedger SET output_exp = output_exp
+        - {_output_exp_per_minute("OLD")} * {_output_logged_minutes("OLD")}
+    WHERE id = 1;
+END;
+"""
+
+# 影响复习计划（DAG 结构、材料进度、作息时间）的表
+PLAN_TABLES = (
+    "Exam",
+    "Subject",
+    "TopicNode",
+    "InputMaterial",
+    "OutputMaterial",
+    "DefaultSchedule",
+    "SpecialSchedule",
+)
+
+db_revision_schema = """
+CREATE TABLE IF NOT EXISTS DbRevision (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    revision INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO DbRevision (id, revision) VALUES (1, 0);
+""" + "".join(
+    f"""
+CREATE TRIGGER IF NOT EXISTS trg_revision_{table.lower()}_{event.lower()}
+AFTER {event} ON {table}
+BEGIN
+    UPDATE DbRevision SET revision = revision + 1 WHERE id = 1;
+END;
+"""
+    for table in PLAN_TABLES
+    for event in ("INSERT", "UPDATE", "DELETE")
+)
+
+plan_store_schema = """
+CREATE TABLE IF NOT EXISTS PlanVersion (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    db_revision INTEGER NOT NULL,
+    start_date TEXT NOT NULL,     -- 'YYYY-MM-DD'
+    start_time TEXT NOT NULL,     -- 'HH:MM'
+    end_date TEXT NOT NULL,       -- 'YYYY-MM-DD'
+    generated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ScheduledSlot (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    plan_version INTEGER NOT NULL,
+    date TEXT NOT NULL,           -- 'YYYY-MM-DD'
+    start_time TEXT NOT NULL,     -- 'HH:MM'
+    end_time TEXT NOT NULL,       -- 'HH:MM'
+    slot_type TEXT NOT NULL,
+    task_id INTEGER NOT NULL,
+    task_title TEXT NOT NULL,
+    FOREIGN KEY (plan_version) REFERENCES PlanVersion(version)
+);
+
+CREATE INDEX IF NOT EXISTS idx_scheduled_slot_range ON ScheduledSlot(plan_version, date, start_time);
+"""
+
+# 常驻 DAG 的每日快照（utils/checkpoint.py 的格式）；修订号一致时重载直接从这里恢复
+dag_snapshot_schema = """
+CREATE TABLE IF NOT EXISTS DagSnapshot (
+    snapshot_date TEXT PRIMARY KEY,   -- 'YYYY-MM-DD'
+    db_revision INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+# 知识点闭包表：每对 (祖先, 后代) 一行，含自身 (depth = 0)。由触发器随插入 / 删除 / 改父节点维护，
+# 子树的读取、删除、材料统计和整棵子树的移动都是一条走索引的集合语句，不用逐层递归查询。
+# 代价在存储和写入上：行数为各节点 (深度 + 1) 之和，即 O(节点数 × 深度)；插入一个知识点写 深度 + 1 行，
+# 移动子树要删写 子树大小 × 祖先数 行。几十层以内的知识点树没有问题，上万层的单链约需 5000 万行，
+# 不适合用闭包表（bench_traversal.py 的 --closure-depth 测的就是这部分开销）。
+topic_closure_schema = """
+CREATE TABLE IF NOT EXISTS TopicClosure (
+    ancestor_id INTEGER NOT NULL,
+    descendant_id INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (ancestor_id, descendant_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_topic_closure_descendant ON TopicClosure(descendant_id, depth, ancestor_id);
+
+-- 回填已有数据；深度上限防止脏数据里的环导致无限递归
+WITH RECURSIVE closure(ancestor_id, descendant_id, depth) AS (
+    SELECT topic_id, topic_id, 0 FROM TopicNode
+    UNION ALL
+    SELECT c.ancestor_id, t.topic_id, c.depth + 1
+    FROM closure c JOIN TopicNode t ON t.parent_id = c.descendant_id
+    WHERE c.depth < (SELECT COUNT(*) FROM TopicNode)
+)
+INSERT OR IGNORE INTO TopicClosure (ancestor_id, descendant_id, depth)
+SELECT ancestor_id, descendant_id, depth FROM closure;
+
+CREATE TRIGGER IF NOT EXISTS trg_topic_closure_insert AFTER INSERT ON TopicNode
+BEGIN
+    INSERT INTO TopicClosure (ancestor_id, descendant_id, depth)
+    SELECT ancestor_id, NEW.topic_id, depth + 1 FROM TopicClosure WHERE descendant_id = NEW.parent_id
+    UNION ALL
+    SELECT NEW.topic_id, NEW.topic_id, 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_topic_closure_delete AFTER DELETE ON TopicNode
+BEGIN
+    DELETE FROM TopicClosure WHERE descendant_id = OLD.topic_id;
+    DELETE FROM TopicClosure WHERE ancestor_id = OLD.topic_id;
+END;
+
+-- 改父节点：先断开子树与原祖先的连接，再把新父节点的每个祖先连到子树的每个节点
+CREATE TRIGGER IF NOT EXISTS trg_topic_closure_move AFTER UPDATE OF parent_id ON TopicNode
+WHEN OLD.parent_id IS NOT NEW.parent_id
+BEGIN
+    DELETE FROM TopicClosure
+    WHERE descendant_id IN (SELECT descendant_id FROM TopicClosure WHERE ancestor_id = NEW.topic_id)
+        AND ancestor_id NOT IN (SELECT descendant_id FROM TopicClosure WHERE ancestor_id = NEW.topic_id);
+    INSERT INTO TopicClosure (ancestor_id, descendant_id, depth)
+    SELECT a.ancestor_id, d.descendant_id, a.depth + d.depth + 1
+    FROM TopicClosure a JOIN TopicClosure d
+    WHERE a.descendant_id = NEW.parent_id AND d.ancestor_id = NEW.topic_id;
+END;
+"""
+
+# 全文检索：每张源表一个外部内容的 FTS5 表（rowid 即源表主键，不另存文本），触发器保持同步。
+# trigram 分词按三个字符切分，中文标题不需要分词也能做子串匹配；不足三个字符的词由查询端回退到 LIKE。
+# (FTS 表, 源表, 主键列, 文本列)
+SEARCH_TABLES = (
+    ("TopicSearch", "TopicNode", "topic_id", "name"),
+    ("InputMaterialSearch", "InputMaterial", "input_id", "title"),
+    ("OutputMaterialSearch", "OutputMaterial", "output_id", "title"),
+    ("ReviewNoteSearch", "ReviewTaskLog", "id", "notes"),
+)
+
+search_schema = "".join(
+    f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+    {column}, content='{table}', content_rowid='{key}', tokenize='trigram'
+);
+
+INSERT INTO {fts}({fts}) VALUES ('rebuild');
+
+CREATE TRIGGER IF NOT EXISTS trg_{fts.lower()}_insert AFTER INSERT ON {table}
+BEGIN
+    INSERT INTO {fts}(rowid, {column}) VALUES (NEW.{key}, NEW.{column});
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{fts.lower()}_delete AFTER DELETE ON {table}
+BEGIN
+    INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', OLD.{key}, OLD.{column});
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{fts.lower()}_update AFTER UPDATE OF {column} ON {table}
+BEGIN
+    INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', OLD.{key}, OLD.{column});
+    INSERT INTO {fts}(rowid, {column}) VALUES (NEW.{key}, NEW.{column});
+END;
+"""
+    for fts, table, key, column in SEARCH_TABLES
+)
+
+def _daily_stats_delta(row: str, sign: str) -> str:
+    """一条日志对 ReviewDailyStats 的增量（按日期 + 节点类型 upsert）；减到没有日志的行随即删除。"""
+    minutes = f"COALESCE({row}.duration_minutes, 0)"
+    sql = f"""
+    INSERT INTO ReviewDailyStats (date, node_type, minutes, input_minutes, output_minutes, output_exp, log_count)
+    VALUES (
+        {row}.reviewed_at, {row}.node_type,
+        {sign}{minutes},
+        {sign}CASE WHEN {row}.input_material_id IS NOT NULL THEN {minutes} ELSE 0 END,
+        {sign}CASE WHEN {row}.input_material_id IS NULL AND {row}.output_material_id IS NOT NULL
+            THEN {minutes} ELSE 0 END,
+        {sign}CASE WHEN {row}.input_material_id IS NULL AND {row}.output_material_id IS NOT NULL
+            THEN {minutes} * COALESCE((
+                SELECT {_output_exp_per_minute("o")} FROM OutputMaterial o
+                WHERE o.output_id = {row}.output_material_id
+            ), 0)
+            ELSE 0 END,
+        {sign}1
+    )
+    ON CONFLICT (date, node_type) DO UPDATE SET
+        minutes = minutes + excluded.minutes,
+        input_minutes = input_minutes + excluded.input_minutes,
+        output_minutes = output_minutes + excluded.output_minutes,
+        output_exp = output_exp + excluded.output_exp,
+        log_count = log_count + excluded.log_count;"""
+    if sign == "-":
+        sql += f"""
+    DELETE FROM ReviewDailyStats
+    WHERE date = {row}.reviewed_at AND node_type = {row}.node_type AND log_count = 0;"""
+    return sql
+
+
+def _daily_output_exp_delta(rate_delta: str, row: str) -> str:
+    """输出材料的每分钟 EXP 变化时，按天把它已记录的时长乘上变化量。"""
+    return f"""
+    UPDATE ReviewDailyStats SET output_exp = output_exp + ({rate_delta}) * m.minutes
+    FROM (
+        SELECT reviewed_at, node_type, SUM(COALESCE(duration_minutes, 0)) AS minutes
+        FROM ReviewTaskLog
+        WHERE output_material_id = {row}.output_id AND input_material_id IS NULL
+        GROUP BY reviewed_at, node_type
+    ) AS m
+    WHERE ReviewDailyStats.date = m.reviewed_at AND ReviewDailyStats.node_type = m.node_type;"""
+
+
+review_daily_stats_schema = f"""
+CREATE TABLE IF NOT EXISTS ReviewDailyStats (
+    date TEXT NOT NULL,               -- 'YYYY-MM-DD'，即 ReviewTaskLog.reviewed_at
+    node_type TEXT NOT NULL,
+    minutes INTEGER NOT NULL DEFAULT 0,
+    input_minutes INTEGER NOT NULL DEFAULT 0,
+    output_minutes INTEGER NOT NULL DEFAULT 0,
+    output_exp REAL NOT NULL DEFAULT 0,
+    log_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (date, node_type)
+) WITHOUT ROWID;
+
+-- 回填：与 utils.review_stats.DAILY_STATS_BACKFILL 相同的口径，但冻结在迁移里，EXP 规则以后变化也不影响本迁移
+INSERT INTO ReviewDailyStats (date, node_type, minutes, input_minutes, output_minutes, output_exp, log_count)
+SELECT l.reviewed_at, l.node_type,
+    SUM(COALESCE(l.duration_minutes, 0)),
+    SUM(CASE WHEN l.input_material_id IS NOT NULL THEN COALESCE(l.duration_minutes, 0) ELSE 0 END),
+    SUM(CASE WHEN l.input_material_id IS NULL AND l.output_material_id IS NOT NULL
+        THEN COALESCE(l.duration_minutes, 0) ELSE 0 END),
+    SUM(CASE WHEN l.input_material_id IS NULL AND l.output_material_id IS NOT NULL
+        THEN COALESCE(l.duration_minutes, 0) * {_output_exp_per_minute("o")} ELSE 0 END),
+    COUNT(*)
+FROM ReviewTaskLog l
+LEFT JOIN OutputMaterial o ON o.output_id = l.output_material_id
+GROUP BY l.reviewed_at, l.node_type;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_log_insert AFTER INSERT ON ReviewTaskLog
+BEGIN{_daily_stats_delta("NEW", "")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_log_delete AFTER DELETE ON ReviewTaskLog
+BEGIN{_daily_stats_delta("OLD", "-")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_log_update AFTER UPDATE ON ReviewTaskLog
+BEGIN{_daily_stats_delta("OLD", "-")}{_daily_stats_delta("NEW", "")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_output_insert AFTER INSERT ON OutputMaterial
+BEGIN{_daily_output_exp_delta(_output_exp_per_minute("NEW"), "NEW")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_output_update AFTER UPDATE OF accuracy, is_completed ON OutputMaterial
+BEGIN{_daily_output_exp_delta(f"{_output_exp_per_minute('NEW')} - {_output_exp_per_minute('OLD')}", "NEW")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_output_delete AFTER DELETE ON OutputMaterial
+BEGIN{_daily_output_exp_delta(f"-{_output_exp_per_minute('OLD')}", "OLD")}
+END;
+"""
+
+# 按需排程的分页游标：续排状态存在服务端，客户端只拿到一个短令牌（见 utils/schedule_cursor.py）
+schedule_cursor_schema = """
+CREATE TABLE IF NOT EXISTS ScheduleCursor (
+    token TEXT PRIMARY KEY,
+    db_revision INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL                -- 续排状态，紧凑 JSON
+);
+"""
+
+# 版本化迁移：(版本号, 说明, SQL)。只允许在末尾追加，已发布的迁移不要再改。
+# 版本号记录在 PRAGMA user_version 中，老的 review_plan.db 会被原地升级。
+MIGRATIONS: List[Tuple[int, str, str]] = [
+    (1, "基础表结构", schema),
+    (
+        2,
+        "热点查询索引",
+        """
+CREATE INDEX IF NOT EXISTS idx_topic_parent ON TopicNode(parent_id, topic_id);
+CREATE INDEX IF NOT EXISTS idx_topic_subject_root ON TopicNode(subject_id, parent_id, topic_id);
+CREATE INDEX IF NOT EXISTS idx_input_topic ON InputMaterial(topic_id);
+CREATE INDEX IF NOT EXISTS idx_output_owner ON OutputMaterial(owner_type, owner_id);
+CREATE INDEX IF NOT EXISTS idx_log_reviewed_at_exp ON ReviewTaskLog(
+    reviewed_at, input_material_id, output_material_id, duration_minutes
+);
+""",
+    ),
+    (
+        3,
+        "复习记录分页索引",
+        """
+CREATE INDEX IF NOT EXISTS idx_log_reviewed_at ON ReviewTaskLog(reviewed_at);
+CREATE INDEX IF NOT EXISTS idx_log_node ON ReviewTaskLog(node_type, node_id, reviewed_at);
+""",
+    ),
+    (4, "EXP 汇总账本", exp_ledger_schema),
+    (5, "数据库修订号", db_revision_schema),
+    (6, "持久化复习计划", plan_store_schema),
+    (7, "DAG 每日快照", dag_snapshot_schema),
+    (8, "知识点闭包表", topic_closure_schema),
+    (9, "全文检索", search_schema),
+    (10, "每日复习汇总", review_daily_stats_schema),
+    (11, "排程分页游标", schedule_cursor_schema),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# 热点查询及其应命中的索引：(名称, SQL, 参数, 索引名)
+HOT_QUERIES: List[Tuple[str, str, tuple, str]] = [
+    (
+        "list_topics 按学科",
+        "SELECT * FROM TopicNode WHERE subject_id = ?",
+        (1,),
+        "idx_topic_subject_root",
+    ),
+    (
+        "get_topic_materials 输入材料",
+        "SELECT input_id, type, title, required_hours, reviewed_hours, is_completed "
+        "FROM InputMaterial WHERE topic_id = ?",
+        (1,),
+        "idx_input_topic",
+    ),
+    (
+        "get_materials 输出材料",
+        "SELECT output_id, type, title, accuracy, required_hours, reviewed_hours, is_completed "
+        "FROM OutputMaterial WHERE owner_type = ? AND owner_id = ? ORDER BY output_id",
+        ("topic", 1),
+        "idx_output_owner",
+    ),
+    (
+        "exp_history 按日聚合",
+        f"SELECT {BUCKET_SQL['day']} AS period, SUM({DAILY_EXP_SQL}) FROM ReviewDailyStats d "
+        "WHERE d.date BETWEEN ? AND ? GROUP BY period",
+        ("2025-01-01", "2025-01-07"),
+        "PRIMARY KEY",
+    ),
+    (
+        "连续打卡",
+        "SELECT date FROM ReviewDailyStats WHERE node_type = 'topic' AND minutes > 0 "
+        "AND date <= ? ORDER BY date DESC",
+        ("2025-01-07",),
+        "PRIMARY KEY",
+    ),
+    (
+        "get_review_tasks 分页",
+        "SELECT id, reviewed_at FROM ReviewTaskLog "
+        "WHERE reviewed_at <= ? AND (reviewed_at < ? OR id < ?) "
+        "ORDER BY reviewed_at DESC, id DESC LIMIT 51",
+        ("2025-05-01", "2025-05-01", 100),
+        "idx_log_reviewed_at",
+    ),
+    (
+        "get_review_tasks 按节点",
+        "SELECT id, reviewed_at FROM ReviewTaskLog "
+        "WHERE node_type = ? AND node_id = ? "
+        "ORDER BY reviewed_at DESC, id DESC LIMIT 51",
+        ("topic", 1),
+        "idx_log_node",
+    ),
+    (
+        "ExpLedger 触发器 输出材料日志",
+        "SELECT SUM(duration_minutes) FROM ReviewTaskLog "
+        "WHERE output_material_id = ? AND input_material_id IS NULL",
+        (1,),
+        "idx_log_output",
+    ),
+    (
+        "get_schedule 读取持久化计划",
+        "SELECT date, start_time, end_time, slot_type, task_id, task_title FROM ScheduledSlot "
+        "WHERE plan_version = ? AND date >= ? AND (date > ? OR end_time > ?) "
+        "ORDER BY date, start_time",
+        (1, "2025-01-01", "2025-01-01", "12:00"),
+        "idx_scheduled_slot_range",
+    ),
+    (
+        "知识点子树",
+        "SELECT descendant_id, depth FROM TopicClosure WHERE ancestor_id = ?",
+        (1,),
+        "PRIMARY KEY",
+    ),
+    (
+        "知识点祖先链",
+        "SELECT ancestor_id FROM TopicClosure WHERE descendant_id = ? ORDER BY depth DESC",
+        (1,),
+        "idx_topic_closure_descendant",
+    ),
+]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """把数据库升级到最新版本，返回升级后的版本号。"""
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, description, script in MIGRATIONS:
+        if version <= current:
+            continue
+        # 迁移脚本和版本号放在同一个事务里，失败时整体回滚
+        try:
+            conn.executescript(
+                f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;"
+            )
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        print(f"⬆️ 数据库已迁移到版本 {version}：{description}")
+        current = version
+    return current
+
+
+def check_query_plans(conn: sqlite3.Connection) -> List[str]:
+    """用 EXPLAIN QUERY PLAN 检查热点查询是否命中预期索引，返回问题列表。"""
+    problems = []
+    for name, sql, params, index in HOT_QUERIES:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        details = [row[-1] for row in plan]
+        if not any(index in detail for detail in details):
+            problems.append(f"{name}: 未使用索引 {index} -> {details}")
+        elif any("TEMP B-TREE" in detail for detail in details):
+            problems.append(f"{name}: 排序未被索引覆盖 -> {details}")
+    return problems
+
+
+def initialize_database(db_path: str = DB_NAME):
+    with sqlite3.connect(db_path) as conn:
+        migrate(conn)
     print("✅ 数据库初始化完成！")
 
 
 if __name__ == "__main__":
-    initialize_database()
+    parser = argparse.ArgumentParser(description="初始化 / 迁移数据库")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument(
+        "--check-plans",
+        action="store_true",
+        help="在最新结构的内存库上检查热点查询是否走索引",
+    )
+    args = parser.parse_args()
+
+    if args.check_plans:
+        with sqlite3.connect(":memory:") as conn:
+            migrate(conn)
+            problems = check_query_plans(conn)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            sys.exit(1)
+        print("✅ 所有热点查询都命中了索引")
+    else:
+        initialize_database(args.db)
@@ -1,15 +1,38 @@
+import asyncio
+import base64
+import json
 import sqlite3
+from contextlib import asynccontextmanager
 from datetime import date, datetime, timedelta
+from itertools import takewhile
 from typing import Any, Dict, List, Optional
 
-from fastapi import Body, FastAPI, HTTPException, Request
+from fastapi import Body, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from init_db import initialize_database
 from pydantic import BaseModel
 from utils.achievement_registry import load_achievement_registry
-from utils.dag import DAG
+from utils.dag_store import (DAGStore, exam_delta, input_delta, output_delta,
+                             read_revision, subject_delta, topic_delta)
+from utils.exp import BUCKET_SQL, exp_history, read_total_exp, rebuild_exp_ledger
 from utils.level import calculate_level
-from utils.schedule import schedule_review, to_frontend_format
-from utils.time_slot import get_available_slots
+from utils.plan_cache import PlanCache
+from utils.plan_store import (PlanRefresher, load_latest_meta, load_plan_rows,
+                              save_plan)
+from utils.review_stats import (rebuild_daily_stats, review_calendar,
+                                streak_summary)
+from utils.schedule import (ScheduleTrace, frontend_row, iter_schedule,
+                            iter_schedule_resumable, reschedule_review,
+                            to_frontend_format)
+from utils.schedule_cursor import load_cursor_state, save_cursor_state
+from utils.search import SEARCH_KINDS, search
+from utils.time_slot import (MINUTES_PER_DAY, format_day, get_available_minutes,
+                             iter_available_minutes, load_availability,
+                             parse_day, round_up_to_slot)
+from utils.tree import (attach_progress, delete_topic_subtree, dumps_deep,
+                        fetch_topic_forest, is_in_subtree, move_topic_subtree,
+                        subtree_material_counts, topic_path)
 from utils.user_context import build_user_context
 
 
@@ -39,6 +62,11 @@ class TopicUpdate(BaseModel):
     importance: Optional[float] = None
 
 
+class TopicMove(BaseModel):
+    parent_id: Optional[int] = None  # None 表示移到学科顶层
+    subject_id: Optional[int] = None  # 移到顶层时使用，默认留在原学科
+
+
 class MaterialInput(BaseModel):
     type: str
     title: str
@@ -88,7 +116,16 @@ class UserContext(BaseModel):
     completed_materials: List[Dict[str, Any]]
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时把已有的 review_plan.db 原地迁移到最新结构
+    initialize_database(DB_NAME)
+    refresher_task = asyncio.create_task(plan_refresher.run())
+    yield
+    refresher_task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -119,66 +156,96 @@ NODE_TYPES_MAPPING = {
 
 registry = load_achievement_registry()
 
+# 考试 / 科目的选择方式："strict" 为严格优先级轮转，"fair" 为按优先级比例分配时间
+SCHEDULE_SELECTION = "strict"
+# 科目内挑材料的方式："first" 为深度优先取第一个，"score" 按重要度、准确率、剩余时长打分
+SCHEDULE_TASK_ORDER = "first"
 
-def fetch_tree(subject_id: int) -> List[Dict[str, Any]]:
-    def get_children(conn, parent_id):
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT topic_id, name, accuracy, importance, is_leaf FROM TopicNode
-            WHERE parent_id = ? ORDER BY topic_id
-        """,
-            (parent_id,),
-        )
-        children = []
-        for row in cursor.fetchall():
-            children.append(
-                {
-                    "topic_id": row[0],
-                    "name": row[1],
-                    "accuracy": row[2],
-                    "importance": row[3],
-                    "is_leaf": row[4],
-                    "children": get_children(conn, row[0]),
-                }
-            )
-        return children
+# 每个 worker 进程常驻一份 DAG，写接口以增量方式同步
+resident_dag = DAGStore(DB_NAME, selection=SCHEDULE_SELECTION, task_order=SCHEDULE_TASK_ORDER)
+
+# 排程范围：从今天起向后排多少天（含今天）；/api/schedule 的 to 默认值、后台重排和空闲时长都用它
+SCHEDULE_HORIZON_DAYS = 120
+
+# 复习计划缓存：键为 (数据库修订号, 起始日期, 起始时间段, 结束日期)
+plan_cache = PlanCache()
+# 上一次排程的逐段检查点；只记录学习时长的小改动可以从受影响的时间段开始重排
+last_schedule_trace: Optional[ScheduleTrace] = None
+
+
+def _schedule_start():
+    now = datetime.now()
+    return now.strftime("%Y-%m-%d"), round_up_to_slot(now.strftime("%H:%M"))
 
+
+def _schedule_end_date() -> str:
+    """排程范围的最后一天，随日期滚动。"""
+    return (date.today() + timedelta(days=SCHEDULE_HORIZON_DAYS - 1)).isoformat()
+
+
+def compute_plan(start_date: str, start_time: str, end_date: str):
+    """返回 (数据库修订号, schedule_review 原始计划)，按修订号和排程起点缓存。"""
     with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT topic_id, name, accuracy, importance, is_leaf FROM TopicNode
-            WHERE subject_id = ? AND parent_id IS NULL ORDER BY topic_id
-        """,
-            (subject_id,),
-        )
-        top_nodes = []
-        for row in cursor.fetchall():
-            top_nodes.append(
-                {
-                    "topic_id": row[0],
-                    "name": row[1],
-                    "accuracy": row[2],
-                    "importance": row[3],
-                    "is_leaf": row[4],
-                    "children": get_children(conn, row[0]),
-                }
-            )
-        return top_nodes
+        revision = read_revision(conn)
+
+    def compute():
+        global last_schedule_trace
+        with resident_dag.checkout() as dag:
+            time_slots = get_available_minutes(start_date, end_date, DB_NAME, start_time=start_time)
+            raw_schedule, last_schedule_trace = reschedule_review(dag, time_slots, last_schedule_trace)
+            actual_revision = resident_dag.revision
+        key = (actual_revision, start_date, start_time, end_date)
+        return key, (actual_revision, raw_schedule)
+
+    return plan_cache.get_or_compute((revision, start_date, start_time, end_date), compute)
+
+
+def compute_plan_window(until_date: str) -> List[Dict[str, Any]]:
+    """惰性排程，只算到 until_date（含）为止，不缓存。"""
+    start_date, start_time = _schedule_start()
+    with resident_dag.checkout() as dag:
+        time_slots = iter_available_minutes(start_date, _schedule_end_date(), DB_NAME, start_time=start_time)
+        return list(takewhile(lambda row: row["date"] <= until_date, iter_schedule(dag, time_slots)))
+
+
+def _persisted_plan_is_stale() -> bool:
+    start_date, start_time = _schedule_start()
+    with sqlite3.connect(DB_NAME) as conn:
+        meta = load_latest_meta(conn)
+        revision = read_revision(conn)
+    if meta is None:
+        return True
+    return (meta["db_revision"], meta["start_date"], meta["start_time"], meta["end_date"]) != (
+        revision, start_date, start_time, _schedule_end_date()
+    )
+
+
+def _refresh_persisted_plan():
+    start_date, start_time = _schedule_start()
+    end_date = _schedule_end_date()
+    revision, raw_schedule = compute_plan(start_date, start_time, end_date)
+    with sqlite3.connect(DB_NAME) as conn:
+        save_plan(conn, raw_schedule, revision, start_date, start_time, end_date)
+    # 每天留一份常驻 DAG 的快照，进程重启后同一修订号直接从快照恢复
+    resident_dag.save_daily_snapshot()
+
+
+# 后台重排：写接口提交后通知，防抖后把计划写入 ScheduledSlot
+plan_refresher = PlanRefresher(_persisted_plan_is_stale, _refresh_persisted_plan)
+resident_dag.add_listener(plan_refresher.notify)
 
 
 @app.post("/api/exam/")
 def create_exam(data: ExamCreate):
     if not 0 <= data.priority <= 9:
         raise HTTPException(400, "priority must be 0-9")
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
         cur = conn.cursor()
         cur.execute(
             "INSERT INTO Exam (exam_name, priority) VALUES (?, ?)",
             (data.exam_name, data.priority),
         )
-        conn.commit()
+        deltas.append(exam_delta(conn, cur.lastrowid, created=True))
     return {"status": "created", "exam_id": cur.lastrowid}
 
 
@@ -193,12 +260,12 @@ def update_exam(exam_id: int, data: ExamUpdate):
             fields.append(f"{f} = ?")
             vals.append(v)
     if fields:
-        with sqlite3.connect(DB_NAME) as conn:
+        with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
             conn.execute(
                 f"UPDATE Exam SET {', '.join(fields)} WHERE exam_id = ?",
                 (*vals, exam_id),
             )
-            conn.commit()
+            deltas.append(exam_delta(conn, exam_id))
     return {"status": "updated"}
 
 
@@ -231,27 +298,27 @@ def update_subject(subject_id: int, data: SubjectUpdate):
             fields.append(f"{f} = ?")
             vals.append(v)
     if fields:
-        with sqlite3.connect(DB_NAME) as conn:
+        with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
             conn.execute(
                 f"UPDATE Subject SET {', '.join(fields)} WHERE subject_id = ?",
                 (*vals, subject_id),
             )
-            conn.commit()
+            deltas.append(subject_delta(conn, subject_id))
     return {"status": "updated"}
 
 
 @app.post("/api/subject/")
 def create_subject(data: SubjectCreate):
-    with sqlite3.connect(DB_NAME) as conn:
+    if not 0 <= data.priority <= 9:
+        raise HTTPException(400, "priority must be 0-9")
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
         cursor = conn.cursor()
-        if not 0 <= data.priority <= 9:
-            raise HTTPException(400, "priority must be 0-9")
         cursor.execute(
             "INSERT INTO Subject (exam_id, subject_name, priority) VALUES (?, ?, ?)",
             (data.exam_id, data.subject_name, data.priority),
         )
-        conn.commit()
         subject_id = cursor.lastrowid
+        deltas.append(subject_delta(conn, subject_id, created=True))
     return {"status": "created", "subject_id": subject_id}
 
 
@@ -268,25 +335,51 @@ def get_review_tree():
         """
         )
         subjects = cursor.fetchall()
+        forest = fetch_topic_forest(conn)
 
     result = []
-    for subject in subjects:
-        # subject_id, subject_name, exam_id, exam_name = subject
-        subject_id, subject_name, subj_pri, exam_id, exam_name, exam_pri = subject
-        topics = fetch_tree(subject_id)
-        result.append(
-            {
-                "subject_id": subject_id,
-                "subject_name": subject_name,
-                "priority": subj_pri,
-                "exam_id": exam_id,
-                "exam_name": exam_name,
-                "exam_priority": exam_pri,
-                "topics": topics,
-            }
-        )
+    # 子树汇总（剩余 / 已复习时长、完成数）直接取自常驻 DAG，不再额外查询
+    with resident_dag.view() as dag:
+        for subject in subjects:
+            # subject_id, subject_name, exam_id, exam_name = subject
+            subject_id, subject_name, subj_pri, exam_id, exam_name, exam_pri = subject
+            topics = forest.get(subject_id, [])
+            attach_progress(topics, dag)
+            subject_node = dag.subject_nodes.get(subject_id)
+            exam_node = dag.exam_nodes.get(exam_id)
+            result.append(
+                {
+                    "subject_id": subject_id,
+                    "subject_name": subject_name,
+                    "priority": subj_pri,
+                    "exam_id": exam_id,
+                    "exam_name": exam_name,
+                    "exam_priority": exam_pri,
+                    "progress": subject_node.progress() if subject_node else None,
+                    "exam_progress": exam_node.progress() if exam_node else None,
+                    "topics": topics,
+                }
+            )
 
-    return result
+    # 知识点层级可能很深，FastAPI 默认的递归编码会触到递归深度上限
+    return Response(content=dumps_deep(result, separators=(",", ":")), media_type="application/json")
+
+
+# 全文检索：知识点、输入 / 输出材料、复习笔记
+@app.get("/api/search")
+def search_all(
+    q: str = Query(..., min_length=1),
+    kinds: Optional[str] = Query(None, description="逗号分隔：topics,input_materials,output_materials,notes"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    selected = None
+    if kinds:
+        selected = [kind.strip() for kind in kinds.split(",") if kind.strip()]
+        unknown = [kind for kind in selected if kind not in SEARCH_KINDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown kinds: {', '.join(unknown)}")
+    with sqlite3.connect(DB_NAME) as conn:
+        return {"q": q, **search(conn, q, selected, limit)}
 
 
 @app.get("/api/topic/{topic_id}/materials")
@@ -339,7 +432,7 @@ def get_topic_materials(topic_id: int):
 @app.post("/api/topic/")
 def create_topic(data: TopicCreate):
     print(f"Creating topic: {data}")
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
         cursor = conn.cursor()
         cursor.execute(
             """
@@ -356,7 +449,7 @@ def create_topic(data: TopicCreate):
             ),
         )
         topic_id = cursor.lastrowid
-        conn.commit()
+        deltas.append(topic_delta(conn, topic_id, created=True))
     return {"status": "created", "topic_id": topic_id}
 
 
@@ -369,7 +462,7 @@ async def debug_topic(request: Request):
 # 修改 Topic（支持 name, is_leaf, accuracy, importance）
 @app.put("/api/topic/{topic_id}")
 def update_topic(topic_id: int, data: TopicUpdate):
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
         cursor = conn.cursor()
         cursor.execute("SELECT topic_id FROM TopicNode WHERE topic_id = ?", (topic_id,))
         if cursor.fetchone() is None:
@@ -393,30 +486,89 @@ def update_topic(topic_id: int, data: TopicUpdate):
         sql = f"UPDATE TopicNode SET {', '.join(fields)} WHERE topic_id = ?"
         values.append(topic_id)
         cursor.execute(sql, tuple(values))
-        conn.commit()
+        deltas.append(topic_delta(conn, topic_id))
 
     return {"status": "updated", "topic_id": topic_id}
 
 
-# 删除 Topic（含子材料）
-@app.delete("/api/topic/{topic_id}")
-def delete_topic(topic_id: int):
+# 移动 Topic：整棵子树挂到新的父节点下（或移到学科顶层）
+@app.put("/api/topic/{topic_id}/move")
+def move_topic(topic_id: int, data: TopicMove):
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
+        cursor = conn.cursor()
+        cursor.execute("SELECT subject_id FROM TopicNode WHERE topic_id = ?", (topic_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Topic not found")
+        subject_id = data.subject_id if data.subject_id is not None else row[0]
+
+        if data.parent_id is not None:
+            cursor.execute("SELECT subject_id FROM TopicNode WHERE topic_id = ?", (data.parent_id,))
+            parent = cursor.fetchone()
+            if parent is None:
+                raise HTTPException(status_code=404, detail="Parent topic not found")
+            if is_in_subtree(conn, topic_id, data.parent_id):
+                raise HTTPException(status_code=400, detail="Cannot move a topic under itself or its descendants")
+            subject_id = parent[0]
+        else:
+            cursor.execute("SELECT 1 FROM Subject WHERE subject_id = ?", (subject_id,))
+            if cursor.fetchone() is None:
+                raise HTTPException(status_code=404, detail="Subject not found")
+
+        move_topic_subtree(conn, topic_id, data.parent_id, subject_id)
+        # DAG 里知识点只记父节点，挂接关系随根节点一起更新
+        deltas.append(topic_delta(conn, topic_id))
+    return {"status": "moved", "topic_id": topic_id, "parent_id": data.parent_id, "subject_id": subject_id}
+
+
+# 查询 Topic 子树：全部后代、祖先链和材料统计
+@app.get("/api/topic/{topic_id}/subtree")
+def get_topic_subtree(topic_id: int):
     with sqlite3.connect(DB_NAME) as conn:
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM InputMaterial WHERE topic_id = ?", (topic_id,))
         cursor.execute(
-            "DELETE FROM OutputMaterial WHERE owner_type = 'topic' AND owner_id = ?",
+            """
+            SELECT t.topic_id, t.parent_id, t.name, t.accuracy, t.importance, t.is_leaf, c.depth
+            FROM TopicClosure c JOIN TopicNode t ON t.topic_id = c.descendant_id
+            WHERE c.ancestor_id = ? ORDER BY c.depth, t.topic_id
+        """,
             (topic_id,),
         )
-        cursor.execute("DELETE FROM TopicNode WHERE topic_id = ?", (topic_id,))
-        conn.commit()
-    return {"status": "deleted", "topic_id": topic_id}
+        topics = [
+            {
+                "topic_id": row[0],
+                "parent_id": row[1],
+                "name": row[2],
+                "accuracy": row[3],
+                "importance": row[4],
+                "is_leaf": row[5],
+                "depth": row[6],
+            }
+            for row in cursor.fetchall()
+        ]
+        if not topics:
+            raise HTTPException(status_code=404, detail="Topic not found")
+        return {
+            "topic_id": topic_id,
+            "path": topic_path(conn, topic_id),
+            "topics": topics,
+            **subtree_material_counts(conn, topic_id),
+        }
+
+
+# 删除 Topic（含全部后代及其材料）
+@app.delete("/api/topic/{topic_id}")
+def delete_topic(topic_id: int):
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
+        deleted = delete_topic_subtree(conn, topic_id)
+        deltas.extend(topic_delta(conn, deleted_id) for deleted_id in deleted)
+    return {"status": "deleted", "topic_id": topic_id, "deleted_topics": len(deleted)}
 
 
 # 添加输入材料
 @app.post("/api/topic/{topic_id}/input")
 def add_input_material(topic_id: int, material: MaterialInput):
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
         cursor = conn.cursor()
         cursor.execute(
             """
@@ -431,13 +583,13 @@ def add_input_material(topic_id: int, material: MaterialInput):
                 material.reviewed_hours,
             ),
         )
-        conn.commit()
+        deltas.append(input_delta(conn, cursor.lastrowid))
     return {"status": "input_material added"}
 
 
 @app.put("/api/input/{input_id}")
 def update_input_material(input_id: int, material: MaterialInput):
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
         cursor = conn.cursor()
 
         # 获取 topic_id 和旧的 reviewed_hours
@@ -501,22 +653,22 @@ def update_input_material(input_id: int, material: MaterialInput):
                 ),
             )
 
-        conn.commit()
+        deltas.append(input_delta(conn, input_id))
 
     return {"status": "input_material updated"}
 
 
 @app.delete("/api/input/{input_id}")
 def delete_input_material(input_id: int):
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
         conn.execute("DELETE FROM InputMaterial WHERE input_id = ?", (input_id,))
-        conn.commit()
+        deltas.append(input_delta(conn, input_id))
     return {"status": "input_material deleted"}
 
 
 @app.post("/api/topic/{topic_id}/output")
 def add_output_material(topic_id: int, material: MaterialInput):
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
         cursor = conn.cursor()
         cursor.execute(
             """
@@ -534,13 +686,13 @@ def add_output_material(topic_id: int, material: MaterialInput):
                 material.reviewed_hours,
             ),
         )
-        conn.commit()
+        deltas.append(output_delta(conn, cursor.lastrowid))
     return {"status": "output_material added"}
 
 
 @app.put("/api/output/{output_id}")
 def update_output_material(output_id: int, material: MaterialInput):
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
         cursor = conn.cursor()
 
         cursor.execute(
@@ -604,16 +756,16 @@ def update_output_material(output_id: int, material: MaterialInput):
                 ),
             )
 
-        conn.commit()
+        deltas.append(output_delta(conn, output_id))
 
     return {"status": "output_material updated"}
 
 
 @app.delete("/api/output/{output_id}")
 def delete_output_material(output_id: int):
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
         conn.execute("DELETE FROM OutputMaterial WHERE output_id = ?", (output_id,))
-        conn.commit()
+        deltas.append(output_delta(conn, output_id))
     return {"status": "output_material deleted"}
 
 
@@ -626,7 +778,7 @@ def add_material(material: dict = Body(...)):
     if material["type"] not in ["exercise_set", "mock_exam"]:
         raise HTTPException(status_code=400, detail="Invalid material type")
 
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn) as deltas:
         cursor = conn.cursor()
         cursor.execute(
             """
@@ -647,7 +799,7 @@ def add_material(material: dict = Body(...)):
                 int(material.get("is_completed", False)),
             ),
         )
-        conn.commit()
+        deltas.append(output_delta(conn, cursor.lastrowid))
 
     return {"status": "material added"}
 
@@ -719,79 +871,112 @@ def create_review_task(task: ReviewTaskCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+REVIEW_TASKS_PAGE_MAX = 500
+
+
+def _encode_log_cursor(reviewed_at: str, log_id: int) -> str:
+    raw = f"{reviewed_at}|{log_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_log_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        reviewed_at, log_id = raw.rsplit("|", 1)
+        return reviewed_at, int(log_id)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @app.get("/api/review-tasks")
-def get_review_tasks():
+def get_review_tasks(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=REVIEW_TASKS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    node_type: Optional[str] = None,
+    node_id: Optional[int] = None,
+):
+    """
+    按 (reviewed_at, id) 倒序返回复习记录，一次 LEFT JOIN 解析节点名称和材料标题。
+
+    传入 limit 时按键集分页：若还有下一页，响应头 X-Next-Cursor 给出下一页的 cursor。
+    """
+    conditions, params = [], []
+    if cursor:
+        cur_reviewed_at, cur_id = _decode_log_cursor(cursor)
+        conditions.append("l.reviewed_at <= ? AND (l.reviewed_at < ? OR l.id < ?)")
+        params.extend([cur_reviewed_at, cur_reviewed_at, cur_id])
+    if date_from:
+        conditions.append("l.reviewed_at >= ?")
+        params.append(date_from.isoformat())
+    if date_to:
+        conditions.append("l.reviewed_at <= ?")
+        params.append(date_to.isoformat())
+    if node_type:
+        if node_type not in NODE_TYPES_MAPPING:
+            raise HTTPException(status_code=400, detail="Invalid node_type")
+        conditions.append("l.node_type = ?")
+        params.append(node_type)
+    if node_id is not None:
+        conditions.append("l.node_id = ?")
+        params.append(node_id)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit_clause = ""
+    if limit:
+        # 多取一行用来判断是否还有下一页
+        limit_clause = "LIMIT ?"
+        params.append(limit + 1)
+
     with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT id, reviewed_at, node_type, node_id,
-                   input_material_id, output_material_id,
-                   duration_minutes, notes
-            FROM ReviewTaskLog
-            ORDER BY reviewed_at DESC, id DESC
-            """
+        cur = conn.cursor()
+        cur.execute(
+            f"""
+            SELECT l.id, l.reviewed_at, l.node_type, l.node_id,
+                   l.input_material_id, l.output_material_id,
+                   l.duration_minutes, l.notes,
+                   CASE l.node_type
+                       WHEN 'exam' THEN e.exam_name
+                       WHEN 'subject' THEN s.subject_name
+                       WHEN 'topic' THEN t.name
+                   END,
+                   i.title, o.title
+            FROM ReviewTaskLog l
+            LEFT JOIN Exam e ON l.node_type = 'exam' AND e.exam_id = l.node_id
+            LEFT JOIN Subject s ON l.node_type = 'subject' AND s.subject_id = l.node_id
+            LEFT JOIN TopicNode t ON l.node_type = 'topic' AND t.topic_id = l.node_id
+            LEFT JOIN InputMaterial i ON i.input_id = l.input_material_id
+            LEFT JOIN OutputMaterial o ON o.output_id = l.output_material_id
+            {where}
+            ORDER BY l.reviewed_at DESC, l.id DESC
+            {limit_clause}
+            """,
+            params,
         )
-        rows = cursor.fetchall()
+        rows = cur.fetchall()
 
-        result = []
-        for row in rows:
-            task = {
-                "id": row[0],
-                "reviewed_at": row[1],
-                "node_type": row[2],
-                "node_id": row[3],
-                "input_material_id": row[4],
-                "output_material_id": row[5],
-                "duration_minutes": row[6],
-                "notes": row[7],
-                "node_name": None,
-                "input_material_title": None,
-                "output_material_title": None,
-            }
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_log_cursor(rows[-1][1], rows[-1][0])
 
-            # 查 node 名称
-            if task["node_type"] == "exam":
-                cursor.execute(
-                    "SELECT exam_name FROM Exam WHERE exam_id = ?", (task["node_id"],)
-                )
-                res = cursor.fetchone()
-                task["node_name"] = res[0] if res else None
-            elif task["node_type"] == "subject":
-                cursor.execute(
-                    "SELECT subject_name FROM Subject WHERE subject_id = ?",
-                    (task["node_id"],),
-                )
-                res = cursor.fetchone()
-                task["node_name"] = res[0] if res else None
-            elif task["node_type"] == "topic":
-                cursor.execute(
-                    "SELECT name FROM TopicNode WHERE topic_id = ?", (task["node_id"],)
-                )
-                res = cursor.fetchone()
-                task["node_name"] = res[0] if res else None
-
-            # 查材料标题
-            if task["input_material_id"]:
-                cursor.execute(
-                    "SELECT title FROM InputMaterial WHERE input_id = ?",
-                    (task["input_material_id"],),
-                )
-                res = cursor.fetchone()
-                task["input_material_title"] = res[0] if res else None
-
-            if task["output_material_id"]:
-                cursor.execute(
-                    "SELECT title FROM OutputMaterial WHERE output_id = ?",
-                    (task["output_material_id"],),
-                )
-                res = cursor.fetchone()
-                task["output_material_title"] = res[0] if res else None
-
-            task["node_type"] = task["node_type"]
-            result.append(task)
-
-        return result
+    return [
+        {
+            "id": row[0],
+            "reviewed_at": row[1],
+            "node_type": row[2],
+            "node_id": row[3],
+            "input_material_id": row[4],
+            "output_material_id": row[5],
+            "duration_minutes": row[6],
+            "notes": row[7],
+            "node_name": row[8],
+            "input_material_title": row[9],
+            "output_material_title": row[10],
+        }
+        for row in rows
+    ]
 
 
 @app.get("/api/schedule/default")
@@ -810,7 +995,8 @@ def get_default_schedule():
 
 @app.post("/api/schedule/default")
 def set_default_schedule(blocks: List[TimeBlock]):
-    with sqlite3.connect(DB_NAME) as conn:
+    # 作息表不在 DAG 中，write() 只用来让常驻 DAG 跟上修订号
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn):
         cursor = conn.cursor()
         cursor.execute("DELETE FROM DefaultSchedule")
         for block in blocks:
@@ -818,7 +1004,6 @@ def set_default_schedule(blocks: List[TimeBlock]):
                 "INSERT INTO DefaultSchedule (day_of_week, start_time, end_time) VALUES (?, ?, ?)",
                 (block.day_of_week, block.start_time, block.end_time),
             )
-        conn.commit()
     return {"status": "default schedule updated"}
 
 
@@ -840,75 +1025,233 @@ def get_special_schedule():
 
 @app.post("/api/schedule/special")
 def add_special_schedule(item: SpecialTimeBlock):
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn):
         cursor = conn.cursor()
         cursor.execute(
             "INSERT INTO SpecialSchedule (date, start_time, end_time) VALUES (?, ?, ?)",
             (item.date, item.start_time, item.end_time),
         )
-        conn.commit()
     return {"status": "special schedule added"}
 
 
 @app.delete("/api/schedule/special/{schedule_id}")
 def delete_special_schedule(schedule_id: int):
-    with sqlite3.connect(DB_NAME) as conn:
+    with sqlite3.connect(DB_NAME) as conn, resident_dag.write(conn):
         cursor = conn.cursor()
         cursor.execute("DELETE FROM SpecialSchedule WHERE id = ?", (schedule_id,))
-        conn.commit()
     return {"status": "special schedule deleted"}
 
 
-@app.get("/api/schedule")
-def get_schedule():
-    start_date = datetime.today().strftime("%Y-%m-%d")
+def _persisted_schedule(days: Optional[int]):
+    today = datetime.today().strftime("%Y-%m-%d")
     now_time = datetime.now().strftime("%H:%M")
-    end_date = "2025-08-21"
+    window_end = (date.today() + timedelta(days=days - 1)).isoformat() if days else None
+
+    with sqlite3.connect(DB_NAME) as conn:
+        meta = load_latest_meta(conn)
+        revision = read_revision(conn)
+        if meta is not None:
+            raw_schedule = load_plan_rows(conn, meta["version"], today, now_time, window_end)
+
+    stale = meta is not None and (meta["db_revision"] != revision or meta["end_date"] != _schedule_end_date())
+    if meta is None or (window_end is not None and stale):
+        # 没有可用的持久化计划：同步计算（只看几天时只算到窗口末尾），并通知后台重排
+        plan_refresher.notify()
+        if window_end is not None:
+            raw_schedule = compute_plan_window(window_end)
+        else:
+            start_date, start_time = _schedule_start()
+            _, raw_schedule = compute_plan(start_date, start_time, _schedule_end_date())
+        return {"schedule": to_frontend_format(raw_schedule), "plan_version": None, "stale": False}
+
+    generated_at = datetime.fromisoformat(meta["generated_at"])
+    return {
+        "schedule": to_frontend_format(raw_schedule),
+        "plan_version": meta["version"],
+        "generated_at": meta["generated_at"],
+        "age_seconds": int((datetime.now() - generated_at).total_seconds()),
+        "based_on_revision": meta["db_revision"],
+        "current_revision": revision,
+        "stale": stale,
+    }
 
-    dag = DAG(DB_NAME)
-    time_slots = get_available_slots(start_date, end_date, DB_NAME, start_time=now_time)
-    raw_schedule = schedule_review(dag, time_slots)
-    human_readable = to_frontend_format(raw_schedule)
 
-    return {"schedule": human_readable}
+SCHEDULE_PAGE_MAX = 1000
 
 
-@app.get("/api/user-level")
-def get_user_level():
+def _load_schedule_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    游标形如 "修订号.令牌"，续排状态存在 ScheduleCursor 表里。
+
+    令牌不存在时：修订号已变则返回 409（游标随修订号一起被清理了），否则 400。
+    """
+    revision, _, token = cursor.partition(".")
     with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT input_material_id, output_material_id, duration_minutes
-            FROM ReviewTaskLog
-        """
+        current = read_revision(conn)
+        stored = load_cursor_state(conn, token) if revision.isdigit() and token else None
+    if stored is None:
+        if revision.isdigit() and int(revision) != current:
+            raise HTTPException(status_code=409, detail="Plan inputs changed; restart without cursor")
+        raise HTTPException(status_code=400, detail="Invalid or expired cursor")
+    state = stored[1]
+    state["rev"] = stored[0]
+    state["vt"] = [tuple(entry) for entry in state["vt"]]
+    state["mat"] = [tuple(entry) for entry in state["mat"]]
+    return state
+
+
+def _schedule_page(date_from: str, date_to: str, limit: Optional[int], state: Optional[Dict[str, Any]]):
+    """
+    按需排程一页，返回 (前端格式的计划行, {"next_cursor": ...})。
+
+    游标对应的续排状态（相对数据库的材料进度变化、轮转游标、下一子段的位置）存在服务端，
+    下一页直接从这里接着排，不重排前面的时间段。
+    整页在借出常驻 DAG 期间算完，返回前就释放锁，响应发给客户端时不再占着 DAG。
+    """
+    with resident_dag.checkout() as dag:
+        revision = resident_dag.revision
+        base_states = dag.material_states()
+        if state is None:
+            start_date, start_time = _schedule_start()
+            time_slots = iter_available_minutes(start_date, date_to, DB_NAME, start_time=start_time)
+            seg_offset = 0
+        elif state["rev"] != revision:
+            # 检查之后、借出之前又有写入
+            return [], {"next_cursor": None, "stale": True}
+        else:
+            dag.apply_material_states(state["mat"])
+            dag.last_exam_id, dag.last_subject_id = state["cur"]
+            dag.virtual_time.update(((node_type, node_id), v) for node_type, node_id, v in state["vt"])
+            resume_day = format_day(state["min"] // MINUTES_PER_DAY)
+            time_slots = iter_available_minutes(resume_day, date_to, DB_NAME, not_before=state["min"])
+            seg_offset = state["seg"]
+
+        if limit is None:
+            # 不分页：整块分配更快，也不需要在行边界导出状态
+            rows = ((row, None) for row in iter_schedule(dag, time_slots))
+        else:
+            rows = iter_schedule_resumable(dag, time_slots, seg_offset)
+
+        page, next_state = [], None
+        for row, resume in rows:
+            if row["date"] < date_from:
+                continue
+            page.append(frontend_row(row))
+            if limit is not None and len(page) >= limit:
+                if resume is None:
+                    break
+                current = dag.material_states()
+                next_state = {
+                    "to": date_to,
+                    "seg": resume[0],
+                    "min": resume[1],
+                    "cur": [dag.last_exam_id, dag.last_subject_id],
+                    "vt": [[node_type, node_id, v] for (node_type, node_id), v in dag.virtual_time.items()],
+                    "mat": [
+                        [kind, material_id, *progress]
+                        for (kind, material_id), progress in current.items()
+                        if progress != base_states.get((kind, material_id))
+                    ],
+                }
+                break
+
+    if next_state is None:
+        return page, {"next_cursor": None}
+    with sqlite3.connect(DB_NAME) as conn:
+        token = save_cursor_state(conn, revision, next_state)
+    return page, {"next_cursor": f"{revision}.{token}"}
+
+
+@app.get("/api/schedule")
+def get_schedule(
+    days: Optional[int] = Query(None, ge=1),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=SCHEDULE_PAGE_MAX),
+    cursor: Optional[str] = None,
+    output: str = Query("json", alias="format"),
+):
+    """
+    不带参数时返回后台生成好的整个计划期；days 只取从今天起的这几天。
+
+    带 from / to / limit / cursor 或 format=ndjson 时按需排程：
+    to 默认为计划期末，limit 为每页行数，下一页用返回的 next_cursor（不带 to 时沿用游标里的 to）；
+    format=ndjson 时每行一条计划，最后一行是 {"next_cursor": ...}，不带 limit 时每页 SCHEDULE_PAGE_MAX 行。
+    """
+    if output not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    if date_from is None and date_to is None and limit is None and cursor is None and output == "json":
+        return _persisted_schedule(days)
+
+    state = _load_schedule_cursor(cursor) if cursor else None
+    if date_to is None and days:
+        date_to = date.today() + timedelta(days=days - 1)
+    if state is not None:
+        # 续页沿用第一页的 to：计划期末随日期滚动，跨过午夜后重新取默认值会对不上
+        if date_to is not None and date_to.isoformat() != state["to"]:
+            raise HTTPException(status_code=400, detail="cursor was issued for a different 'to'")
+        date_to = date.fromisoformat(state["to"])
+    if date_to is None:
+        date_to = date.fromisoformat(_schedule_end_date())
+    date_from = date_from or date.today()
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+
+    if state is not None:
+        with sqlite3.connect(DB_NAME) as conn:
+            if read_revision(conn) != state["rev"]:
+                raise HTTPException(status_code=409, detail="Plan inputs changed; restart without cursor")
+
+    if output == "ndjson" and limit is None:
+        limit = SCHEDULE_PAGE_MAX
+    # 整页算完再响应：慢客户端读流时不占着常驻 DAG 的锁
+    schedule, tail = _schedule_page(date_from.isoformat(), date_to.isoformat(), limit, state)
+    if output == "ndjson":
+        return StreamingResponse(
+            (json.dumps(item, ensure_ascii=False) + "\n" for item in [*schedule, tail]),
+            media_type="application/x-ndjson",
         )
-        rows = cursor.fetchall()
 
-        total_exp = 0
+    return {
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "schedule": schedule,
+        "next_cursor": tail["next_cursor"],
+        "stale": tail.get("stale", False),
+    }
 
-        for input_id, output_id, duration in rows:
-            minutes = duration or 0
 
-            if input_id:
-                # 输入材料：每小时1 EXP
-                total_exp += minutes / 60
+@app.get("/api/schedule/free-hours")
+def get_free_hours(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+):
+    date_from = date_from or datetime.today().date()
+    date_to = date_to or date.fromisoformat(_schedule_end_date())
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="from must not be after to")
 
-            elif output_id:
-                # 输出材料：查准确率和是否完成
-                cursor.execute(
-                    """
-                    SELECT accuracy, is_completed FROM OutputMaterial WHERE output_id = ?
-                """,
-                    (output_id,),
-                )
-                row = cursor.fetchone()
+    with sqlite3.connect(DB_NAME) as conn:
+        calendar = load_availability(conn)
+    minutes = calendar.free_minutes(parse_day(date_from.isoformat()), parse_day(date_to.isoformat()))
 
-                if row:
-                    accuracy, is_completed = row
-                    if is_completed and accuracy is not None:
-                        # 输出材料：每小时 (1/0.6) × accuracy
-                        total_exp += minutes / 60.0 * (1 / 0.6) * accuracy
+    return {
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "free_hours": round(minutes / 60, 2),
+    }
+
+
+@app.get("/api/schedule/cache-stats")
+def get_schedule_cache_stats():
+    return plan_cache.stats()
+
+
+@app.get("/api/user-level")
+def get_user_level():
+    # ExpLedger 由触发器在写日志、修改输出材料时增量维护
+    with sqlite3.connect(DB_NAME) as conn:
+        total_exp = read_total_exp(conn)
 
     total_exp = int(total_exp)
     result = calculate_level(total_exp)
@@ -916,60 +1259,78 @@ def get_user_level():
     return result
 
 
+@app.post("/api/user-level/rebuild")
+def rebuild_user_level():
+    with sqlite3.connect(DB_NAME) as conn:
+        total_exp = rebuild_exp_ledger(conn)
+    return {"status": "rebuilt", "raw_exp": int(total_exp)}
+
+
 @app.get("/api/exp-weekly")
 def get_cumulative_weekly_exp():
     today = datetime.today().date()
     start_day = today - timedelta(days=6)
 
     with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT reviewed_at, input_material_id, output_material_id, duration_minutes
-            FROM ReviewTaskLog
-            WHERE reviewed_at >= ?
-            ORDER BY reviewed_at ASC
-        """,
-            (start_day.isoformat(),),
-        )
-        rows = cursor.fetchall()
+        points = exp_history(conn, start_day, today, "day")
+
+    return [
+        {"date": p["date"], "cumulative_exp": p["cumulative_exp"]} for p in points
+    ]
+
+
+@app.get("/api/exp-history")
+def get_exp_history(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    bucket: str = "day",
+):
+    if bucket not in BUCKET_SQL:
+        raise HTTPException(status_code=400, detail="bucket must be day, week or month")
+    date_to = date_to or datetime.today().date()
+    date_from = date_from or date_to - timedelta(days=6)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+
+    with sqlite3.connect(DB_NAME) as conn:
+        points = exp_history(conn, date_from, date_to, bucket)
+
+    return {
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "bucket": bucket,
+        "points": points,
+    }
+
+
+@app.get("/api/review-stats/streak")
+def get_review_streak():
+    with sqlite3.connect(DB_NAME) as conn:
+        return streak_summary(conn, datetime.today().date())
+
 
-        # 查询所有 output material 的数据（缓存）
-        cursor.execute("SELECT output_id, accuracy, is_completed FROM OutputMaterial")
-        output_info = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
-
-    # 初始化
-    exp_by_day = {}
-    cumulative_exp = 0
-
-    for day_offset in range(7):
-        day = (start_day + timedelta(days=day_offset)).isoformat()
-        exp_by_day[day] = 0
-
-    # 按时间顺序处理经验
-    for reviewed_at, input_id, output_id, minutes in rows:
-        minutes = minutes or 0
-        reviewed_date = reviewed_at
-        exp = 0
-
-        if input_id:
-            exp = minutes / 60.0
-        elif output_id in output_info:
-            accuracy, is_completed = output_info[output_id]
-            if is_completed and accuracy is not None:
-                exp = minutes * (1 / 0.6) * accuracy
-
-        if reviewed_date in exp_by_day:
-            exp_by_day[reviewed_date] += exp
-
-    # 转为累加值
-    cumulative_list = []
-    running_total = 0
-    for day in sorted(exp_by_day.keys()):
-        running_total += exp_by_day[day]
-        cumulative_list.append({"date": day, "cumulative_exp": round(running_total, 2)})
-
-    return cumulative_list
+@app.get("/api/review-stats/calendar")
+def get_review_calendar(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+):
+    date_to = date_to or datetime.today().date()
+    date_from = date_from or date_to - timedelta(days=364)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    if (date_to - date_from).days > 366 * 5:
+        raise HTTPException(status_code=400, detail="range must not exceed 5 years")
+
+    with sqlite3.connect(DB_NAME) as conn:
+        days = review_calendar(conn, date_from, date_to)
+    return {"from": date_from.isoformat(), "to": date_to.isoformat(), "days": days}
+
+
+@app.post("/api/review-stats/rebuild")
+def rebuild_review_stats():
+    with sqlite3.connect(DB_NAME) as conn:
+        rows = rebuild_daily_stats(conn)
+    return {"status": "rebuilt", "days": rows}
 
 
 @app.get("/api/achievements/all")
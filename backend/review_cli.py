@@ -1,9 +1,12 @@
 
 import sqlite3
 import argparse
-import json
 from typing import Optional
 
+from utils.exp import rebuild_exp_ledger
+from utils.review_stats import rebuild_daily_stats
+from utils.tree import delete_topic_subtree, dumps_deep, fetch_topic_forest
+
 DB_NAME = "review_plan.db"
 
 def connect():
@@ -50,11 +53,9 @@ def add_output(topic_id, type, title, accuracy):
 
 def delete_topic(topic_id):
     with connect() as conn:
-        conn.execute("DELETE FROM InputMaterial WHERE topic_id = ?", (topic_id,))
-        conn.execute("DELETE FROM OutputMaterial WHERE topic_id = ?", (topic_id,))
-        conn.execute("DELETE FROM TopicNode WHERE topic_id = ?", (topic_id,))
+        deleted = delete_topic_subtree(conn, topic_id)
         conn.commit()
-        print("🗑️ Topic deleted.")
+        print(f"🗑️ Topic deleted, with {len(deleted) - 1} descendant topic(s) and all their materials." if deleted else "⚠️ Topic not found.")
 
 def list_exams():
     with connect() as conn:
@@ -77,57 +78,31 @@ def list_topics(subject_id: Optional[int] = None):
         for row in rows:
             print(row)
 
-def fetch_tree(subject_id: int):
-    def get_children(conn, parent_id):
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT topic_id, name, accuracy, importance, is_leaf FROM TopicNode WHERE parent_id = ? ORDER BY topic_id",
-            (parent_id,)
-        )
-        children = []
-        for row in cursor.fetchall():
-            children.append({
-                "topic_id": row[0],
-                "name": row[1],
-                "accuracy": row[2],
-                "importance": row[3],
-                "is_leaf": row[4],
-                "children": get_children(conn, row[0])
-            })
-        return children
-
-    with connect() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT topic_id, name, accuracy, importance, is_leaf FROM TopicNode WHERE subject_id = ? AND parent_id IS NULL ORDER BY topic_id",
-            (subject_id,)
-        )
-        top_nodes = []
-        for row in cursor.fetchall():
-            top_nodes.append({
-                "topic_id": row[0],
-                "name": row[1],
-                "accuracy": row[2],
-                "importance": row[3],
-                "is_leaf": row[4],
-                "children": get_children(conn, row[0])
-            })
-        return top_nodes
-
 def export_tree():
     with connect() as conn:
         subjects = conn.execute("SELECT subject_id, subject_name FROM Subject").fetchall()
+        forest = fetch_topic_forest(conn)
         data = []
         for s in subjects:
             data.append({
                 "subject_id": s[0],
                 "subject_name": s[1],
-                "topics": fetch_tree(s[0])
+                "topics": forest.get(s[0], [])
             })
         with open("exported_review_tree.json", "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.write(dumps_deep(data, indent=2))
         print("📁 Exported to exported_review_tree.json")
 
+def rebuild_exp():
+    with connect() as conn:
+        total_exp = rebuild_exp_ledger(conn)
+        print(f"✅ EXP ledger rebuilt: {total_exp:.2f}")
+
+def rebuild_stats():
+    with connect() as conn:
+        rows = rebuild_daily_stats(conn)
+        print(f"✅ Daily review stats rebuilt: {rows} rows")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Review DB CLI")
     subparsers = parser.add_subparsers(dest="command")
@@ -170,6 +145,8 @@ if __name__ == "__main__":
     sub.add_argument("--subject_id", type=int)
 
     subparsers.add_parser("export-tree")
+    subparsers.add_parser("rebuild-exp")
+    subparsers.add_parser("rebuild-stats")
 
     args = parser.parse_args()
 
@@ -193,5 +170,9 @@ if __name__ == "__main__":
         list_topics(args.subject_id)
     elif args.command == "export-tree":
         export_tree()
+    elif args.command == "rebuild-exp":
+        rebuild_exp()
+    elif args.command == "rebuild-stats":
+        rebuild_stats()
     else:
         parser.print_help()
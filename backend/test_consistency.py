@@ -0,0 +1,231 @@
+import hashlib
+import json
+import math
+import os
+import random
+import runpy
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+from init_db import initialize_database
+from utils.checkpoint import dump_checkpoint, load_checkpoint
+from utils.dag import DAG
+from utils.exp import rebuild_exp_ledger
+from utils.review_stats import rebuild_daily_stats
+from utils.schedule import iter_schedule_resumable, reschedule_review, schedule_review
+from utils.time_slot import (MINUTES_PER_DAY, format_day, get_available_slots,
+                             iter_available_minutes)
+from utils.tree import delete_topic_subtree, is_in_subtree, move_topic_subtree
+
+# 调度器与触发器维护的汇总表的一致性检查：
+# 整块 / 逐段、增量重排 / 整体重排、检查点恢复 / 全新加载必须排出同一份计划，
+# ExpLedger、ReviewDailyStats、TopicClosure 在随机改动后必须与整体重建的结果一致。
+# 用法（在 backend 目录下）：python -m pytest test_consistency.py
+
+START_DATE, END_DATE, START_TIME = "2025-04-15", "2025-10-22", "13:07"
+MODES = [(selection, order) for selection in ("strict", "fair") for order in ("first", "score")]
+
+# 改动调度器之前的原始算法（只有 strict / first）在 sample_db 上排出的计划：(行数, JSON 的 sha256)
+LEGACY_PLAN_DIGEST = (267, "8329554881b58905f6c245ca55c10105e8bfdb7115b50f0bdb6d609928dbf5d7")
+
+
+@contextmanager
+def _chdir(path):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope="module")
+def sample_db(tmp_path_factory):
+    """insert_sample_data 生成的库（固定随机种子），再按 id 给一部分材料加上学习进度。"""
+    directory = tmp_path_factory.mktemp("sample")
+    path = str(directory / "review_plan.db")
+    initialize_database(path)
+    random.seed(20250415)
+    with _chdir(directory):
+        runpy.run_path(os.path.join(os.path.dirname(__file__), "insert_sample_data.py"))
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE InputMaterial SET reviewed_hours = required_hours / 2 WHERE input_id % 3 = 0")
+        conn.execute("UPDATE InputMaterial SET reviewed_hours = required_hours, is_completed = 1 WHERE input_id % 7 = 0")
+        conn.execute("UPDATE OutputMaterial SET reviewed_hours = 0.5 WHERE output_id % 4 = 0 AND required_hours > 0.5")
+        conn.commit()
+    return path
+
+
+def _slots(db):
+    return get_available_slots(START_DATE, END_DATE, db, start_time=START_TIME)
+
+
+def _minutes(db, start_date=START_DATE, **kwargs):
+    kwargs.setdefault("start_time", START_TIME if start_date == START_DATE else None)
+    return iter_available_minutes(start_date, END_DATE, db, **kwargs)
+
+
+def _digest(plan):
+    return len(plan), hashlib.sha256(json.dumps(plan, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# ───────────── 调度器 ─────────────
+def test_matches_legacy_algorithm(sample_db):
+    assert _digest(schedule_review(DAG(sample_db), _slots(sample_db))) == LEGACY_PLAN_DIGEST
+
+
+@pytest.mark.parametrize("selection, order", MODES)
+def test_block_matches_step(sample_db, selection, order):
+    slots = _slots(sample_db)
+    block = schedule_review(DAG(sample_db, selection=selection, task_order=order), slots)
+    step = schedule_review(DAG(sample_db, selection=selection, task_order=order), slots, block=False)
+    assert block and block == step
+
+
+@pytest.mark.parametrize("selection, order", MODES)
+def test_checkpoint_matches_fresh(sample_db, selection, order):
+    slots = _slots(sample_db)
+    fresh = schedule_review(DAG(sample_db, selection=selection, task_order=order), slots)
+    restored = load_checkpoint(dump_checkpoint(DAG(sample_db, selection=selection, task_order=order)), sample_db)
+    assert schedule_review(restored.dag, slots) == fresh
+
+
+@pytest.mark.parametrize("selection, order", MODES)
+def test_resume_mid_plan(sample_db, selection, order):
+    """在任意行边界导出检查点、从续排位置接着排，与一次排完相同。"""
+    full = schedule_review(DAG(sample_db, selection=selection, task_order=order), _slots(sample_db))
+    for cut in (1, 7, len(full) // 2):
+        dag = DAG(sample_db, selection=selection, task_order=order)
+        head = []
+        for row, resume in iter_schedule_resumable(dag, _minutes(sample_db)):
+            head.append(row)
+            if len(head) == cut:
+                break
+        restored = load_checkpoint(dump_checkpoint(dag), sample_db).dag
+        seg, minute = resume
+        time_slots = _minutes(sample_db, format_day(minute // MINUTES_PER_DAY), not_before=minute)
+        tail = [row for row, _ in iter_schedule_resumable(restored, time_slots, seg)]
+        assert head + tail == full, cut
+
+
+@pytest.mark.parametrize("selection, order", MODES)
+def test_incremental_matches_full_replan(sample_db, selection, order):
+    """只改未完成材料的已学时长时，增量重排与整体重排相同。"""
+    slots = _slots(sample_db)
+    dag = DAG(sample_db, selection=selection, task_order=order)
+    progress = dag.save_progress()
+    _, trace = reschedule_review(dag, slots)
+    dag.restore_progress(progress)
+
+    rng = random.Random(order)
+    for _ in range(5):
+        key, (reviewed, completed) = rng.choice(sorted(dag.material_states().items()))
+        material = dag.material_by_key(key)
+        if completed or reviewed + 0.25 >= material.required_hours:
+            continue
+        edit = [(*key, reviewed + 0.25, False)]
+        dag.apply_material_states(edit)
+        progress = dag.save_progress()
+        plan, trace = reschedule_review(dag, slots, trace)
+        dag.restore_progress(progress)
+
+        fresh = DAG(sample_db, selection=selection, task_order=order)
+        fresh.apply_material_states([(*k, r, c) for k, (r, c) in dag.material_states().items()])
+        assert plan == schedule_review(fresh, slots), key
+
+
+# ───────────── 触发器维护的汇总表 ─────────────
+def _random_edits(conn, rng, rounds):
+    topics = [row[0] for row in conn.execute("SELECT topic_id FROM TopicNode")]
+    for k in range(rounds):
+        inputs = [row[0] for row in conn.execute("SELECT input_id FROM InputMaterial")]
+        outputs = [row[0] for row in conn.execute("SELECT output_id FROM OutputMaterial")]
+        logs = [row[0] for row in conn.execute("SELECT id FROM ReviewTaskLog")]
+        day = f"2025-05-{rng.randint(1, 10):02d}"
+        r = rng.random()
+        if r < 0.35 or not logs:
+            conn.execute(
+                """
+                INSERT INTO ReviewTaskLog (reviewed_at, node_type, node_id, input_material_id, output_material_id,
+                    duration_minutes, notes)
+                VALUES (?, ?, 1, ?, ?, ?, 'n')
+            """,
+                (day, rng.choice(["topic", "subject", "exam"]),
+                 rng.choice(inputs) if inputs and rng.random() < 0.5 else None,
+                 rng.choice(outputs) if outputs and rng.random() < 0.6 else None,
+                 rng.randint(0, 90)),
+            )
+        elif r < 0.5 and outputs:
+            conn.execute(
+                "UPDATE OutputMaterial SET accuracy = ?, is_completed = ? WHERE output_id = ?",
+                (rng.choice([None, 0.3, 0.9]), rng.randint(0, 1), rng.choice(outputs)),
+            )
+        elif r < 0.6:
+            conn.execute("DELETE FROM ReviewTaskLog WHERE id = ?", (rng.choice(logs),))
+        elif r < 0.7:
+            conn.execute(
+                "UPDATE ReviewTaskLog SET duration_minutes = ?, reviewed_at = ?, node_type = ? WHERE id = ?",
+                (rng.randint(0, 60), day, rng.choice(["topic", "exam"]), rng.choice(logs)),
+            )
+        elif r < 0.75 and outputs:
+            conn.execute("DELETE FROM OutputMaterial WHERE output_id = ?", (rng.choice(outputs),))
+        elif r < 0.85:
+            parent = rng.choice(topics + [None])
+            subject_id = (
+                conn.execute("SELECT subject_id FROM TopicNode WHERE topic_id = ?", (parent,)).fetchone()[0]
+                if parent else rng.choice([row[0] for row in conn.execute("SELECT subject_id FROM Subject")])
+            )
+            cursor = conn.execute(
+                "INSERT INTO TopicNode (subject_id, parent_id, name, importance, is_leaf) VALUES (?, ?, ?, 5, 1)",
+                (subject_id, parent, f"t{k}"),
+            )
+            topics.append(cursor.lastrowid)
+        elif r < 0.95:
+            topic_id, parent = rng.choice(topics), rng.choice(topics + [None])
+            if parent is None or not is_in_subtree(conn, topic_id, parent):
+                subject_id = conn.execute(
+                    "SELECT subject_id FROM TopicNode WHERE topic_id = ?", (parent or topic_id,)
+                ).fetchone()[0]
+                move_topic_subtree(conn, topic_id, parent, subject_id)
+        else:
+            deleted = set(delete_topic_subtree(conn, rng.choice(topics)))
+            topics = [t for t in topics if t not in deleted]
+        conn.commit()
+
+
+def _assert_rows_close(got, expected):
+    assert len(got) == len(expected)
+    for a, b in zip(got, expected):
+        assert len(a) == len(b)
+        for x, y in zip(a, b):
+            assert x == y or (isinstance(x, float) and math.isclose(x, y, abs_tol=1e-9)), (a, b)
+
+
+def _expected_closure(conn):
+    parents = dict(conn.execute("SELECT topic_id, parent_id FROM TopicNode"))
+    closure = set()
+    for topic_id in parents:
+        ancestor, depth = topic_id, 0
+        while ancestor in parents:
+            closure.add((ancestor, topic_id, depth))
+            ancestor, depth = parents[ancestor], depth + 1
+    return closure
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_trigger_tables_match_rebuild(sample_db, tmp_path, seed):
+    path = str(tmp_path / "edits.db")
+    with sqlite3.connect(sample_db) as source, sqlite3.connect(path) as conn:
+        source.backup(conn)
+        _random_edits(conn, random.Random(seed), 300)
+
+        ledger = conn.execute("SELECT * FROM ExpLedger ORDER BY id").fetchall()
+        daily = conn.execute("SELECT * FROM ReviewDailyStats ORDER BY date, node_type").fetchall()
+        assert set(conn.execute("SELECT ancestor_id, descendant_id, depth FROM TopicClosure")) == _expected_closure(conn)
+
+        rebuild_exp_ledger(conn)
+        rebuild_daily_stats(conn)
+        _assert_rows_close(ledger, conn.execute("SELECT * FROM ExpLedger ORDER BY id").fetchall())
+        _assert_rows_close(daily, conn.execute("SELECT * FROM ReviewDailyStats ORDER BY date, node_type").fetchall())
@@ -0,0 +1,101 @@
+from typing import Dict, List, Optional, Tuple
+
+# 每天的可用时间用一个 1440 位的整数表示：第 m 位为 1 表示当天第 m 分钟可用。
+# 并集、交集、差集都是整数位运算；重叠或首尾相接的时间段自然合并。
+MINUTES_PER_DAY = 24 * 60
+
+
+def range_mask(start: int, end: int) -> int:
+    """[start, end) 分钟区间对应的位图；越界部分截掉。"""
+    start, end = max(start, 0), min(end, MINUTES_PER_DAY)
+    if start >= end:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+def union(a: int, b: int) -> int:
+    return a | b
+
+
+def intersect(a: int, b: int) -> int:
+    return a & b
+
+
+def subtract(a: int, b: int) -> int:
+    return a & ~b
+
+
+def mask_runs(mask: int) -> List[Tuple[int, int]]:
+    """把位图拆成若干 [start, end) 连续区间，按时间排序。"""
+    runs = []
+    while mask:
+        low = mask & -mask
+        start = low.bit_length() - 1
+        carried = mask + low          # 从 start 开始的一串 1 进位到第一个 0 上
+        end = (carried & -carried).bit_length() - 1
+        runs.append((start, end))
+        mask &= ~((1 << end) - 1)
+    return runs
+
+
+def first_free_run(mask: int, length: int, from_minute: int = 0) -> Optional[int]:
+    """从 from_minute 起第一段长度至少为 length 分钟的空闲时间的开始分钟；没有则返回 None。"""
+    if length <= 0:
+        return from_minute
+    mask = subtract(mask, range_mask(0, from_minute))
+    # 倍增：covered 位连续为 1 的起点
+    covered = 1
+    while covered < length and mask:
+        step = min(covered, length - covered)
+        mask &= mask >> step
+        covered += step
+    if not mask:
+        return None
+    return (mask & -mask).bit_length() - 1
+
+
+def free_minutes(mask: int) -> int:
+    return mask.bit_count()
+
+
+class AvailabilityCalendar:
+    """
+    DefaultSchedule / SpecialSchedule 的位图视图。
+
+    某天如果有特别计划，就完全替换当天的默认周计划（与原先的语义一致）。
+    day 均为自 1970-01-01 起的天数。
+    """
+
+    def __init__(self, weekday_masks: List[int], special_masks: Dict[int, int]):
+        self.weekday_masks = weekday_masks
+        self.special_masks = special_masks
+
+    def day_mask(self, day: int) -> int:
+        mask = self.special_masks.get(day)
+        if mask is None:
+            mask = self.weekday_masks[(day + 3) % 7]   # 1970-01-01 是星期四（weekday() == 3）
+        return mask
+
+    def free_minutes(self, first_day: int, last_day: int) -> int:
+        """[first_day, last_day] 内的可用分钟数（含两端）。"""
+        if last_day < first_day:
+            return 0
+        days = last_day - first_day + 1
+        weeks, rest = divmod(days, 7)
+        weekday_minutes = [free_minutes(m) for m in self.weekday_masks]
+        total = weeks * sum(weekday_minutes)
+        for day in range(last_day - rest + 1, last_day + 1):
+            total += weekday_minutes[(day + 3) % 7]
+        # 有特别计划的日子按特别计划计
+        for day, mask in self.special_masks.items():
+            if first_day <= day <= last_day:
+                total += free_minutes(mask) - weekday_minutes[(day + 3) % 7]
+        return total
+
+    def first_free_run(self, first_day: int, last_day: int, length: int, from_minute: int = 0) -> Optional[Tuple[int, int]]:
+        """[first_day, last_day] 内第一段至少 length 分钟的空闲时间，返回 (day, 开始分钟)。"""
+        for day in range(first_day, last_day + 1):
+            start = first_free_run(self.day_mask(day), length, from_minute if day == first_day else 0)
+            if start is not None:
+                return day, start
+        return None
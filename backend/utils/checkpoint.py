@@ -0,0 +1,161 @@
+import json
+import sqlite3
+import struct
+import zlib
+from datetime import date, datetime
+from typing import Optional
+
+from .dag import DAG, DAGNode, Material, gc_paused
+
+# 检查点格式：4 字节魔数 + 1 字节版本号 + zlib 压缩的紧凑 JSON。
+# 改动载荷结构时必须加版本号；读到不认识的版本直接拒绝，由调用方回退到从数据库加载。
+CHECKPOINT_MAGIC = b"RPCK"
+CHECKPOINT_VERSION = 4
+_HEADER = struct.Struct("<4sB")
+
+# 节点类型 -> 其子节点所在的表
+_CHILD_TYPE = {"exam": "subject", "subject": "topic", "topic": "topic"}
+
+
+class Checkpoint:
+    """
+    从检查点恢复出的 DAG 与调度状态。
+
+    revision 为生成时的数据库修订号（可为 None）。
+    跨请求的续排不走检查点，分页游标的续排状态见 schedule_cursor.py。
+    """
+
+    def __init__(self, dag: DAG, revision: Optional[int]):
+        self.dag = dag
+        self.revision = revision
+
+
+def _node_registries(dag: DAG):
+    return {"exam": dag.exam_nodes, "subject": dag.subject_nodes, "topic": dag.topic_nodes}
+
+
+def dump_checkpoint(dag: DAG, revision: Optional[int] = None) -> bytes:
+    """
+    把 DAG 的结构、学习进度、未完成计数与子树汇总、轮转游标和虚拟时间序列化成一个版本化的紧凑 blob。
+
+    保留各字典和子节点 / 材料列表的顺序，恢复后的调度结果与原 DAG 完全一致。
+    只应在行边界调用（整块分配的中途进度不完整）。
+    """
+    nodes = {
+        node_type: [
+            [
+                n.node_id, n.name, n.priority, n.accuracy,
+                n.unfinished_children_count, n.unfinished_inputs_count, n.unfinished_outputs_count,
+                n.required_hours, n.reviewed_hours, n.material_count, n.completed_count,
+                [c.node_id for c in n.children],
+                [m.material_id for m in n.inputs],
+                [m.material_id for m in n.outputs],
+            ]
+            for n in registry.values()
+        ]
+        for node_type, registry in _node_registries(dag).items()
+    }
+
+    def material_rows(registry):
+        return [
+            [m.material_id, m.title, m.type, m.required_hours, m.reviewed_hours, int(m.is_completed),
+             m.owner_type, m.owner_id]
+            for m in registry.values()
+        ]
+
+    payload = {
+        "rev": revision,
+        "sel": dag.selection,
+        "ord": dag.task_order,
+        "cur": [dag.last_exam_id, dag.last_subject_id],
+        "vt": [[node_type, node_id, v] for (node_type, node_id), v in dag.virtual_time.items()],
+        "nodes": nodes,
+        "inputs": material_rows(dag.input_materials),
+        "outputs": material_rows(dag.output_materials),
+    }
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION) + zlib.compress(body)
+
+
+def load_checkpoint(blob: bytes, db_path: str) -> Checkpoint:
+    """dump_checkpoint 的逆操作，不访问数据库；格式不对或版本不认识时抛出 ValueError。"""
+    if len(blob) < _HEADER.size:
+        raise ValueError("checkpoint too short")
+    magic, version = _HEADER.unpack_from(blob)
+    if magic != CHECKPOINT_MAGIC:
+        raise ValueError("not a checkpoint")
+    if version != CHECKPOINT_VERSION:
+        raise ValueError(f"unsupported checkpoint version {version}")
+    try:
+        payload = json.loads(zlib.decompress(blob[_HEADER.size:]).decode("utf-8"))
+        with gc_paused():
+            return _restore(payload, db_path)
+    except (zlib.error, UnicodeError, KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"corrupt checkpoint: {e}")
+
+
+def _restore(payload, db_path: str) -> Checkpoint:
+    dag = DAG(db_path, load=False, selection=payload["sel"], task_order=payload["ord"])
+    materials = {"input": dag.input_materials, "output": dag.output_materials}
+    for kind, registry in materials.items():
+        for material_id, title, type_, req_hrs, rev_hrs, done, owner_type, owner_id in payload[kind + "s"]:
+            material = Material(material_id, title, type_, req_hrs, rev_hrs, bool(done), owner_type, owner_id)
+            material.is_input = kind == "input"
+            registry[material_id] = material
+
+    registries = _node_registries(dag)
+    for node_type, rows in payload["nodes"].items():
+        for (node_id, name, priority, accuracy, children_count, inputs_count, outputs_count,
+             required_hours, reviewed_hours, material_count, completed_count, _, _, _) in rows:
+            node = DAGNode(node_id, name, node_type, priority)
+            node.accuracy = accuracy
+            # 计数和汇总直接恢复，不再整体重算
+            node.unfinished_children_count = children_count
+            node.unfinished_inputs_count = inputs_count
+            node.unfinished_outputs_count = outputs_count
+            node.required_hours = required_hours
+            node.reviewed_hours = reviewed_hours
+            node.material_count = material_count
+            node.completed_count = completed_count
+            registries[node_type][node_id] = node
+
+    for node_type, rows in payload["nodes"].items():
+        child_registry = registries[_CHILD_TYPE[node_type]]
+        for node_id, *_, child_ids, input_ids, output_ids in rows:
+            node = registries[node_type][node_id]
+            for child_id in child_ids:
+                node.add_child(child_registry[child_id])
+            # 直接挂上材料，未完成计数已在上面恢复
+            if input_ids:
+                node.inputs = [dag.input_materials[i] for i in input_ids]
+            if output_ids:
+                node.outputs = [dag.output_materials[i] for i in output_ids]
+
+    dag.last_exam_id, dag.last_subject_id = payload["cur"]
+    dag.virtual_time.update(((node_type, node_id), v) for node_type, node_id, v in payload["vt"])
+    return Checkpoint(dag, payload["rev"])
+
+
+# ───────────── 每日快照：常驻 DAG 重载时若修订号一致，直接从快照恢复 ─────────────
+def save_snapshot(conn: sqlite3.Connection, blob: bytes, db_revision: int):
+    """写入今天的快照，只保留这一份。"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM DagSnapshot")
+    cursor.execute(
+        "INSERT INTO DagSnapshot (snapshot_date, db_revision, created_at, data) VALUES (?, ?, ?, ?)",
+        (date.today().isoformat(), db_revision, datetime.now().isoformat(timespec="seconds"), blob),
+    )
+    conn.commit()
+
+
+def load_snapshot(conn: sqlite3.Connection, db_revision: int) -> Optional[bytes]:
+    """修订号为 db_revision 的快照；没有则返回 None。"""
+    row = conn.execute(
+        "SELECT data FROM DagSnapshot WHERE db_revision = ? ORDER BY snapshot_date DESC LIMIT 1", (db_revision,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def snapshot_date(conn: sqlite3.Connection) -> Optional[str]:
+    row = conn.execute("SELECT MAX(snapshot_date) FROM DagSnapshot").fetchone()
+    return row[0] if row else None
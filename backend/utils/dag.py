@@ -1,49 +1,123 @@
+import gc
+import heapq
 import sqlite3
+import sys
 from collections import defaultdict
-from typing import Dict, List, Optional, Union, Tuple
+from contextlib import contextmanager
+from itertools import chain
+from operator import attrgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Union, Tuple
 
+from .traversal import ENTER, postorder, walk
 
+# 考试 / 科目的选择方式：
+#   strict —— 只在优先级最高的未完成节点之间轮转，低优先级要等高优先级全部完成
+#   fair   —— 加权公平排队，所有未完成节点都按优先级比例分到学习时间
+SELECTION_MODES = ("strict", "fair")
+
+# 在科目子树里挑材料的方式：
+#   first —— 深度优先，按优先级和 id 取第一个未完成的材料
+#   score —— 对整棵子树的候选材料打分，取得分最高的（见 material_score）
+TASK_ORDERS = ("first", "score")
+
+
+# 题库可能有十万级的知识点和材料：两个类都用 __slots__，不为每个实例分配 __dict__
 class Material:
+    __slots__ = ("material_id", "title", "type", "required_hours", "reviewed_hours", "is_completed",
+                 "owner_type", "owner_id", "is_input")
+
     def __init__(self, material_id: int, title: str, type_: str, required_hours: float, reviewed_hours: float, is_completed: bool, owner_type: Optional[str] = None, owner_id: Optional[int] = None):
         self.material_id = material_id
         self.title = title
-        self.type = type_  # 'note', 'video', 'recite', 'exercise_set', 'mock_exam'
+        self.type = sys.intern(type_)  # 'note', 'video', 'recite', 'exercise_set', 'mock_exam'；取值很少，共用一份字符串
         self.required_hours = required_hours
         self.reviewed_hours = reviewed_hours
         self.is_completed = is_completed
-        self.owner_type = owner_type
+        self.owner_type = sys.intern(owner_type) if owner_type else owner_type
         self.owner_id = owner_id
+        self.is_input = False  # 挂到节点上时设置；完成时据此更新对应的未完成计数
 
     def __repr__(self):
         status = "✅" if self.is_completed else "❌"
         return f"Material(ID: {self.material_id}, Type: {self.type}, Title: '{self.title}', {status}, {self.reviewed_hours}/{self.required_hours} hrs)"
 
 
+_EMPTY: tuple = ()
+_children = attrgetter("children")
+
+
+def _done_hours(material: Material) -> float:
+    """材料计入汇总的已复习时长：已完成按需要时长计，未完成的不超过需要时长。"""
+    if material.is_completed:
+        return material.required_hours
+    return min(material.reviewed_hours, material.required_hours)
+
+
+@contextmanager
+def gc_paused():
+    """一次性创建大量对象时，循环垃圾回收会反复扫描刚建好的节点；加载期间先停掉。"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
 class DAGNode:
+    __slots__ = ("node_id", "name", "node_type", "priority", "children", "inputs", "outputs",
+                 "unfinished_children_count", "unfinished_inputs_count", "unfinished_outputs_count", "parent",
+                 "task_cache", "task_cache_generation", "sorted_children", "sorted_children_generation",
+                 "accuracy", "required_hours", "reviewed_hours", "material_count", "completed_count")
+
     def __init__(self, node_id: int, name: str, node_type: str, priority: int = 5):
         self.node_id = node_id
         self.name = name
         self.node_type = node_type  # 'exam', 'subject', 'topic'
         self.priority = priority
-        self.children: List['DAGNode'] = []
-        self.inputs: List[Material] = []
-        self.outputs: List[Material] = []
+        # 大多数知识点没有子节点或输出材料：先共用空元组，第一次添加时才建列表
+        self.children: List['DAGNode'] = _EMPTY
+        self.inputs: List[Material] = _EMPTY
+        self.outputs: List[Material] = _EMPTY
         self.unfinished_children_count = 0
         self.unfinished_inputs_count = 0
         self.unfinished_outputs_count = 0
         self.parent: Optional['DAGNode'] = None
+        # get_next_task 的缓存：{(types, max_hours): 首个可选材料或 None}
+        self.task_cache: Dict[tuple, Optional[Material]] = {}
+        self.task_cache_generation = -1
+        self.sorted_children: List['DAGNode'] = _EMPTY
+        self.sorted_children_generation = -1
+        self.accuracy: Optional[float] = None  # 只有知识点有；未填写时为 None
+        # 整棵子树（含自身）材料的汇总：需要 / 已复习的小时数（已完成的材料按需要时长计），材料数 / 已完成数
+        self.required_hours = 0.0
+        self.reviewed_hours = 0.0
+        self.material_count = 0
+        self.completed_count = 0
 
     def add_child(self, child: 'DAGNode'):
-        self.children.append(child)
+        if self.children:
+            self.children.append(child)
+        else:
+            self.children = [child]
         child.parent = self
 
     def add_input(self, material: Material):
-        self.inputs.append(material)
+        material.is_input = True
+        if self.inputs:
+            self.inputs.append(material)
+        else:
+            self.inputs = [material]
         if not material.is_completed:
             self.unfinished_inputs_count += 1
 
     def add_output(self, material: Material):
-        self.outputs.append(material)
+        material.is_input = False
+        if self.outputs:
+            self.outputs.append(material)
+        else:
+            self.outputs = [material]
         if not material.is_completed:
             self.unfinished_outputs_count += 1
 
@@ -55,116 +129,567 @@ class DAGNode:
             self.unfinished_outputs_count == 0
         )
 
+    @property
+    def remaining_hours(self) -> float:
+        return max(self.required_hours - self.reviewed_hours, 0.0)
+
+    def progress(self) -> Dict[str, Union[int, float]]:
+        """子树汇总，供接口直接返回。"""
+        return {
+            "required_hours": round(self.required_hours, 2),
+            "reviewed_hours": round(self.reviewed_hours, 2),
+            "remaining_hours": round(self.remaining_hours, 2),
+            "materials": self.material_count,
+            "completed_materials": self.completed_count,
+            "percent": round(100 * self.reviewed_hours / self.required_hours, 1) if self.required_hours else 0.0,
+        }
+
     def __repr__(self):
         return f"DAGNode({self.node_type}:{self.node_id}, '{self.name}', priority={self.priority})"
 
 
+class _FairQueue:
+    """
+    加权公平排队：节点的虚拟时间 = 已分到的学习时长 / 优先级，总是先选虚拟时间最小的（相同时按 id）。
+
+    堆中条目惰性失效：虚拟时间变了就压入新条目，旧条目和已完成的节点到达堆顶时才丢弃，
+    因此挑选和记账都是 O(log n)，材料完成时不需要额外维护。
+    """
+
+    def __init__(self, node_type: str, nodes: List[DAGNode], vtime: Dict[Tuple[str, int], float]):
+        self.node_type = node_type
+        self.vtime = vtime
+        # 新加入的节点从当前最小的虚拟时间起步，不追补以前的时间
+        known = [vtime[(node_type, n.node_id)] for n in nodes if (node_type, n.node_id) in vtime]
+        start = min(known, default=0.0)
+        self.size = len(nodes)
+        self.heap = []
+        for n in nodes:
+            self.heap.append((vtime.setdefault((node_type, n.node_id), start), n.node_id, n))
+        heapq.heapify(self.heap)
+
+    def _live(self, entry) -> bool:
+        v, node_id, node = entry
+        return not node.is_completed and self.vtime[(self.node_type, node_id)] == v
+
+    def ordered(self) -> Iterator[DAGNode]:
+        """按虚拟时间从小到大产出未完成的节点；不修改堆，产出前 k 个的代价为 O(k log n)。"""
+        heap = self.heap
+        while heap and not self._live(heap[0]):
+            heapq.heappop(heap)
+        # 把堆数组看成二叉树做最佳优先遍历
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier:
+            entry, idx = heapq.heappop(frontier)
+            for child in (2 * idx + 1, 2 * idx + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+            if self._live(entry):
+                yield entry[2]
+
+    def charge(self, node: DAGNode, hours: float):
+        if hours <= 0:
+            return
+        key = (self.node_type, node.node_id)
+        self.vtime[key] += hours / node.priority
+        heapq.heappush(self.heap, (self.vtime[key], node.node_id, node))
+        if len(self.heap) > 2 * self.size + 8:
+            self.heap = [entry for entry in self.heap if self._live(entry)]
+            heapq.heapify(self.heap)
+
+
+def material_score(material: Material, importance: int, accuracy: Optional[float], ancestor_priority: float) -> float:
+    """
+    score 模式下材料的得分，越高越先排：
+    (1 + 重要度) × (2 - 准确率) × (1 + 祖先平均优先级 / 9) / (1 + 剩余时长)。
+
+    准确率未填写时按 0.5 计；剩余时长越少得分越高，所以一份材料被学习时得分只升不降，
+    整块分配在 score 模式下依然成立。
+    """
+    weakness = 2.0 - (0.5 if accuracy is None else accuracy)
+    remaining = max(material.required_hours - material.reviewed_hours, 0.0)
+    return (1 + importance) * weakness * (1 + ancestor_priority / 9) / (1 + remaining)
+
+
+class _ScoreIndex:
+    """
+    score 模式下一个科目子树的候选材料，每种材料类型一个堆，堆顶得分最高。
+
+    建索引时一次遍历整棵子树记下各材料的打分因子，得分相同时按深度优先的顺序，与 first 模式一致。
+    之后增量维护：学习时长变化时压入新条目，旧条目和已完成的材料到堆顶时丢弃；
+    输出材料要等所属节点的子节点和输入材料都完成才可选，届时由 DAG 加入。
+    """
+
+    def __init__(self):
+        self.heaps: Dict[str, list] = defaultdict(list)
+        self.factors: Dict[Material, Tuple[int, Optional[float], float, int]] = {}
+        self.scores: Dict[Material, float] = {}
+        self.ready_nodes: set = set()
+
+    def add(self, material: Material, importance: int, accuracy: Optional[float], ancestor_priority: float):
+        self.factors[material] = (importance, accuracy, ancestor_priority, len(self.factors))
+
+    def push(self, material: Material):
+        importance, accuracy, ancestor_priority, order = self.factors[material]
+        score = material_score(material, importance, accuracy, ancestor_priority)
+        if self.scores.get(material) == score:
+            return
+        self.scores[material] = score
+        heapq.heappush(self.heaps[material.type], (-score, order, material))
+
+    def _live(self, entry) -> bool:
+        neg_score, _, material = entry
+        return not material.is_completed and self.scores[material] == -neg_score
+
+    def best(self, types: Tuple[str, ...], max_hours: Optional[float]) -> Optional[Material]:
+        """types 中得分最高的可选材料；mock_exam 不能超过 max_hours。"""
+        best_entry = None
+        for type_ in types:
+            heap = self.heaps.get(type_)
+            while heap and not self._live(heap[0]):
+                heapq.heappop(heap)
+            if not heap:
+                continue
+            # 与 _FairQueue.ordered 相同：不修改堆，按得分从高到低找第一个放得下的
+            frontier = [(heap[0], 0)]
+            while frontier:
+                entry, idx = heapq.heappop(frontier)
+                if best_entry is not None and entry[:2] > best_entry[:2]:
+                    break
+                for child in (2 * idx + 1, 2 * idx + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], child))
+                material = entry[2]
+                if not self._live(entry):
+                    continue
+                if material.type == 'mock_exam' and material.required_hours > max_hours:
+                    continue
+                best_entry = entry
+                break
+        return best_entry[2] if best_entry is not None else None
+
+
 class DAG:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, conn: Optional[sqlite3.Connection] = None, load: bool = True,
+                 selection: str = "strict", task_order: str = "first"):
+        """load=False 时得到一个空 DAG，由调用方自行填充（例如从检查点恢复）。"""
+        if selection not in SELECTION_MODES:
+            raise ValueError(f"selection must be one of {SELECTION_MODES}")
+        if task_order not in TASK_ORDERS:
+            raise ValueError(f"task_order must be one of {TASK_ORDERS}")
         self.db_path = db_path
+        self.selection = selection
+        self.task_order = task_order
         self.exam_nodes: Dict[int, DAGNode] = {}
         self.subject_nodes: Dict[int, DAGNode] = {}
         self.topic_nodes: Dict[int, DAGNode] = {}
+        self.input_materials: Dict[int, Material] = {}
+        self.output_materials: Dict[int, Material] = {}
         self.last_exam_id: Optional[int] = None
         self.last_subject_id: Optional[int] = None
-        self._load_from_db()
-        self._update_unfinished_children_count()
-
-    def _load_from_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-
-            cursor.execute("SELECT exam_id, exam_name, priority FROM Exam")
-            for exam_id, exam_name, priority in cursor.fetchall():
-                self.exam_nodes[exam_id] = DAGNode(exam_id, exam_name, 'exam', priority)
-
-            cursor.execute("SELECT subject_id, exam_id, subject_name, priority FROM Subject")
-            for subject_id, exam_id, subject_name, priority in cursor.fetchall():
-                subject_node = DAGNode(subject_id, subject_name, 'subject', priority)
-                self.subject_nodes[subject_id] = subject_node
-                if exam_id in self.exam_nodes:
-                    self.exam_nodes[exam_id].add_child(subject_node)
-
-            cursor.execute("SELECT topic_id, subject_id, parent_id, name, importance FROM TopicNode")
-            temp_topics = {}
-            for topic_id, subject_id, parent_id, name, importance in cursor.fetchall():
-                topic_node = DAGNode(topic_id, name, 'topic', importance)
-                temp_topics[topic_id] = (topic_node, subject_id, parent_id)
-                self.topic_nodes[topic_id] = topic_node
-
-            for topic_id, (node, subject_id, parent_id) in temp_topics.items():
-                if parent_id:
-                    parent_node = self.topic_nodes.get(parent_id)
-                    if parent_node:
-                        parent_node.add_child(node)
-                else:
-                    subject_node = self.subject_nodes.get(subject_id)
-                    if subject_node:
-                        subject_node.add_child(node)
-
-            cursor.execute("SELECT input_id, topic_id, type, title, required_hours, reviewed_hours, is_completed FROM InputMaterial")
-            for input_id, topic_id, type_, title, req_hrs, rev_hrs, is_completed in cursor.fetchall():
-                node = self.topic_nodes.get(topic_id)
-                if node:
-                    material = Material(input_id, title, type_, req_hrs, rev_hrs, bool(is_completed), 'topic', topic_id)
-                    node.add_input(material)
-
-            cursor.execute("SELECT output_id, owner_type, owner_id, type, title, required_hours, reviewed_hours, is_completed FROM OutputMaterial")
-            for output_id, owner_type, owner_id, type_, title, req_hrs, rev_hrs, is_completed in cursor.fetchall():
-                material = Material(output_id, title, type_, req_hrs, rev_hrs, bool(is_completed), owner_type, owner_id)
-                if owner_type == 'exam':
-                    node = self.exam_nodes.get(owner_id)
-                elif owner_type == 'subject':
-                    node = self.subject_nodes.get(owner_id)
-                else:
-                    node = self.topic_nodes.get(owner_id)
-                if node:
-                    node.add_output(material)
-
-    def _update_unfinished_children_count(self):
-        def update_node(node: DAGNode):
-            count = 0
-            for child in node.children:
-                update_node(child)
-                if not child.is_completed:
-                    count += 1
-            node.unfinished_children_count = count
-
-        for exam_node in self.exam_nodes.values():
-            update_node(exam_node)
+        # 缓存代号：结构变化时两者都加一，恢复进度时只加 task 缓存代号
+        self._structure_generation = 0
+        self._progress_generation = 0
+        # 每有材料完成（或进度被恢复）就加一，调度器据此作废“排不出任务”的记录
+        self.completion_epoch = 0
+        # fair 模式的调度状态：{(node_type, node_id): 虚拟时间}，与轮转游标一样随进度保存 / 恢复
+        self.virtual_time: Dict[Tuple[str, int], float] = {}
+        self._fair_generation: Optional[tuple] = None
+        self._exam_queue: Optional[_FairQueue] = None
+        self._subject_queues: Dict[int, _FairQueue] = {}
+        # score 模式的索引：按科目建，材料 / 节点到所在索引的映射用于增量维护
+        self._score_generation: Optional[tuple] = None
+        self._score_indexes: Dict[int, _ScoreIndex] = {}
+        self._score_index_of: Dict[Union[Material, DAGNode], _ScoreIndex] = {}
+        if not load:
+            return
+        with gc_paused():
+            if conn is None:
+                with sqlite3.connect(self.db_path) as conn:
+                    self._load_from_db(conn)
+            else:
+                self._load_from_db(conn)
+            self._update_aggregates()
+
+    def _load_from_db(self, conn: sqlite3.Connection):
+        cursor = conn.cursor()
+
+        # 逐行迭代游标，不先 fetchall 整张表
+        cursor.execute("SELECT exam_id, exam_name, priority FROM Exam")
+        for exam_id, exam_name, priority in cursor:
+            self.exam_nodes[exam_id] = DAGNode(exam_id, exam_name, 'exam', priority)
+
+        cursor.execute("SELECT subject_id, exam_id, subject_name, priority FROM Subject")
+        for subject_id, exam_id, subject_name, priority in cursor:
+            subject_node = DAGNode(subject_id, subject_name, 'subject', priority)
+            self.subject_nodes[subject_id] = subject_node
+            if exam_id in self.exam_nodes:
+                self.exam_nodes[exam_id].add_child(subject_node)
+
+        cursor.execute("SELECT topic_id, subject_id, parent_id, name, importance, accuracy FROM TopicNode")
+        temp_topics = []
+        for topic_id, subject_id, parent_id, name, importance, accuracy in cursor:
+            topic_node = DAGNode(topic_id, name, 'topic', importance)
+            topic_node.accuracy = accuracy
+            temp_topics.append((topic_node, subject_id, parent_id))
+            self.topic_nodes[topic_id] = topic_node
+
+        for node, subject_id, parent_id in temp_topics:
+            if parent_id:
+                parent_node = self.topic_nodes.get(parent_id)
+                if parent_node:
+                    parent_node.add_child(node)
+            else:
+                subject_node = self.subject_nodes.get(subject_id)
+                if subject_node:
+                    subject_node.add_child(node)
+
+        cursor.execute("SELECT input_id, topic_id, type, title, required_hours, reviewed_hours, is_completed FROM InputMaterial")
+        for input_id, topic_id, type_, title, req_hrs, rev_hrs, is_completed in cursor:
+            node = self.topic_nodes.get(topic_id)
+            if node:
+                material = Material(input_id, title, type_, req_hrs, rev_hrs, bool(is_completed), 'topic', topic_id)
+                node.add_input(material)
+                self.input_materials[input_id] = material
+
+        cursor.execute("SELECT output_id, owner_type, owner_id, type, title, required_hours, reviewed_hours, is_completed FROM OutputMaterial")
+        for output_id, owner_type, owner_id, type_, title, req_hrs, rev_hrs, is_completed in cursor:
+            material = Material(output_id, title, type_, req_hrs, rev_hrs, bool(is_completed), owner_type, owner_id)
+            if owner_type == 'exam':
+                node = self.exam_nodes.get(owner_id)
+            elif owner_type == 'subject':
+                node = self.subject_nodes.get(owner_id)
+            else:
+                node = self.topic_nodes.get(owner_id)
+            if node:
+                node.add_output(material)
+                self.output_materials[output_id] = material
+
+    def _update_aggregates(self):
+        # 后根遍历：处理到节点时，子节点的完成状态和子树汇总都已确定
+        for node in postorder(self.exam_nodes.values(), _children):
+            if node.children:
+                node.unfinished_children_count = sum(1 for child in node.children if not child.is_completed)
+            else:
+                node.unfinished_children_count = 0
+            self._sum_subtree(node)
+
+    @staticmethod
+    def _sum_subtree(node: DAGNode):
+        """由自身材料和子节点的汇总重新求和。"""
+        required = reviewed = 0.0
+        total = completed = 0
+        for material in chain(node.inputs, node.outputs):
+            required += material.required_hours
+            reviewed += _done_hours(material)
+            total += 1
+            completed += material.is_completed
+        for child in node.children:
+            required += child.required_hours
+            reviewed += child.reviewed_hours
+            total += child.material_count
+            completed += child.completed_count
+        node.required_hours = required
+        node.reviewed_hours = reviewed
+        node.material_count = total
+        node.completed_count = completed
 
     def update_task(self, material: Material, study_hours: float):
+        self.update_task_steps(material, (study_hours,))
+
+    def update_task_steps(self, material: Material, steps: Iterable[float]) -> int:
+        """
+        依次计入多段学习时长，等价于逐段调用 update_task；
+        材料完成后不再消费后面的时长。返回实际计入的段数。
+        """
         if material.is_completed:
+            return 0
+        before = _done_hours(material)
+        count = 0
+        for study_hours in steps:
+            count += 1
+            material.reviewed_hours += study_hours
+            if material.reviewed_hours >= material.required_hours:
+                self._complete(material)
+                break
+        else:
+            if self.task_order == "score":
+                self._rescore(material)
+        self._add_progress(material, _done_hours(material) - before)
+        return count
+
+    def _add_progress(self, material: Material, hours: float):
+        """沿祖先链累加子树汇总，O(深度)；材料刚完成时同时给完成数加一。"""
+        completed = 1 if material.is_completed else 0
+        if not hours and not completed:
             return
-        material.reviewed_hours += study_hours
-        if material.reviewed_hours >= material.required_hours:
-            material.reviewed_hours = material.required_hours
-            material.is_completed = True
-            if material.owner_type == 'exam':
-                node = self.exam_nodes.get(material.owner_id)
-            elif material.owner_type == 'subject':
-                node = self.subject_nodes.get(material.owner_id)
+        node = self._owner_node(material.owner_type, material.owner_id)
+        while node:
+            node.reviewed_hours += hours
+            node.completed_count += completed
+            node = node.parent
+
+    def _complete(self, material: Material):
+        material.reviewed_hours = material.required_hours
+        material.is_completed = True
+        self.completion_epoch += 1
+        node = self._owner_node(material.owner_type, material.owner_id)
+        if node:
+            if material.is_input:
+                node.unfinished_inputs_count -= 1
             else:
-                node = self.topic_nodes.get(material.owner_id)
-            if node:
-                if material in node.inputs:
-                    node.unfinished_inputs_count -= 1
-                if material in node.outputs:
-                    node.unfinished_outputs_count -= 1
-                self._propagate_completion(node)
+                node.unfinished_outputs_count -= 1
+            # 完成只会让节点从未完成变为已完成：逐级给父节点减一，到第一个仍未完成的节点为止
+            child = node
+            while child.parent and child.is_completed:
+                child.parent.unfinished_children_count -= 1
+                child = child.parent
+            if self.task_order == "score":
+                # 途经的节点可能刚满足输出材料的前提
+                self._sync_score_indexes()
+                ready = node
+                while ready is not child:
+                    self._outputs_ready(ready)
+                    ready = ready.parent
+                self._outputs_ready(child)
+            # 只有这条祖先链上的子树内容变了
+            ancestor = node
+            while ancestor:
+                ancestor.task_cache.clear()
+                ancestor = ancestor.parent
 
     def _propagate_completion(self, node: DAGNode):
+        """结构或材料变更后，沿祖先链重算未完成计数和子树汇总。"""
         while node:
             node.unfinished_children_count = sum(1 for child in node.children if not child.is_completed)
+            self._sum_subtree(node)
             node = node.parent
 
+    def _owner_node(self, owner_type: Optional[str], owner_id: Optional[int]) -> Optional[DAGNode]:
+        if owner_type == 'exam':
+            return self.exam_nodes.get(owner_id)
+        if owner_type == 'subject':
+            return self.subject_nodes.get(owner_id)
+        return self.topic_nodes.get(owner_id)
+
+    # ───────────── 进度快照：借出给调度前保存，调度结束后恢复 ─────────────
+    def save_progress(self):
+        materials = [
+            (m, m.reviewed_hours, m.is_completed)
+            for m in chain(self.input_materials.values(), self.output_materials.values())
+        ]
+        nodes = [
+            (n, n.unfinished_children_count, n.unfinished_inputs_count, n.unfinished_outputs_count,
+             n.reviewed_hours, n.completed_count)
+            for n in chain(self.exam_nodes.values(), self.subject_nodes.values(), self.topic_nodes.values())
+        ]
+        return materials, nodes, self.last_exam_id, self.last_subject_id, dict(self.virtual_time)
+
+    def restore_progress(self, progress):
+        materials, nodes, self.last_exam_id, self.last_subject_id, virtual_time = progress
+        self.virtual_time.clear()
+        self.virtual_time.update(virtual_time)
+        self._progress_generation += 1
+        self.completion_epoch += 1
+        for m, reviewed_hours, is_completed in materials:
+            m.reviewed_hours = reviewed_hours
+            m.is_completed = is_completed
+        for n, children_count, inputs_count, outputs_count, reviewed_hours, completed_count in nodes:
+            n.unfinished_children_count = children_count
+            n.unfinished_inputs_count = inputs_count
+            n.unfinished_outputs_count = outputs_count
+            n.reviewed_hours = reviewed_hours
+            n.completed_count = completed_count
+
+    def apply_material_states(self, states: Iterable[Tuple[str, int, float, bool]]):
+        """把给定材料的进度设为 (kind, material_id, reviewed_hours, is_completed)，用于从游标续排。"""
+        owners = {}
+        for kind, material_id, reviewed_hours, is_completed in states:
+            material = self.material_by_key((kind, material_id))
+            if material is None:
+                continue
+            material.reviewed_hours = reviewed_hours
+            material.is_completed = is_completed
+            node = self._owner_node(material.owner_type, material.owner_id)
+            if node:
+                owners[id(node)] = node
+        for node in owners.values():
+            self._refresh_material_counts(node)
+        self._progress_generation += 1
+        self.completion_epoch += 1
+
+    # ───────────── 增量重排用：材料状态与结构签名 ─────────────
+    def material_key(self, material: Material) -> Tuple[str, int]:
+        if self.input_materials.get(material.material_id) is material:
+            return 'input', material.material_id
+        return 'output', material.material_id
+
+    def material_by_key(self, key: Tuple[str, int]) -> Optional[Material]:
+        kind, material_id = key
+        registry = self.input_materials if kind == 'input' else self.output_materials
+        return registry.get(material_id)
+
+    def material_states(self) -> Dict[Tuple[str, int], Tuple[float, bool]]:
+        """{(kind, material_id): (reviewed_hours, is_completed)}"""
+        states = {('input', m.material_id): (m.reviewed_hours, m.is_completed) for m in self.input_materials.values()}
+        states.update(
+            (('output', m.material_id), (m.reviewed_hours, m.is_completed)) for m in self.output_materials.values()
+        )
+        return states
+
+    def structure_signature(self) -> tuple:
+        """除学习进度外，所有会影响调度结果的字段。"""
+        def parent_of(node: DAGNode):
+            return (node.parent.node_type, node.parent.node_id) if node.parent else None
+
+        nodes = tuple(
+            (n.node_type, n.node_id, n.name, n.priority, n.accuracy, parent_of(n),
+             tuple(m.material_id for m in n.inputs), tuple(m.material_id for m in n.outputs))
+            for n in chain(self.exam_nodes.values(), self.subject_nodes.values(), self.topic_nodes.values())
+        )
+        materials = tuple(
+            (self.material_key(m), m.owner_type, m.owner_id, m.type, m.title, m.required_hours)
+            for m in chain(self.input_materials.values(), self.output_materials.values())
+        )
+        return nodes, materials
+
+    # ───────────── 增量更新：与数据库中的一行保持一致，重复应用结果不变 ─────────────
+    def _attach(self, node: DAGNode, parent: Optional[DAGNode]):
+        old_parent = node.parent
+        if old_parent is parent:
+            return
+        if old_parent:
+            old_parent.children.remove(node)
+            node.parent = None
+            self._propagate_completion(old_parent)
+        if parent:
+            parent.add_child(node)
+            self._propagate_completion(parent)
+
+    def _refresh_material_counts(self, node: DAGNode):
+        node.unfinished_inputs_count = sum(1 for m in node.inputs if not m.is_completed)
+        node.unfinished_outputs_count = sum(1 for m in node.outputs if not m.is_completed)
+        self._propagate_completion(node)
+
+    def upsert_exam(self, exam_id: int, name: str, priority: int):
+        self._structure_generation += 1
+        node = self.exam_nodes.get(exam_id)
+        if node is None:
+            self.exam_nodes[exam_id] = DAGNode(exam_id, name, 'exam', priority)
+        else:
+            node.name = name
+            node.priority = priority
+
+    def upsert_subject(self, subject_id: int, exam_id: int, name: str, priority: int):
+        self._structure_generation += 1
+        node = self.subject_nodes.get(subject_id)
+        if node is None:
+            node = DAGNode(subject_id, name, 'subject', priority)
+            self.subject_nodes[subject_id] = node
+        else:
+            node.name = name
+            node.priority = priority
+        self._attach(node, self.exam_nodes.get(exam_id))
+
+    def upsert_topic(self, topic_id: int, subject_id: int, parent_id: Optional[int], name: str, importance: int,
+                     accuracy: Optional[float] = None):
+        self._structure_generation += 1
+        node = self.topic_nodes.get(topic_id)
+        if node is None:
+            node = DAGNode(topic_id, name, 'topic', importance)
+            self.topic_nodes[topic_id] = node
+        else:
+            node.name = name
+            node.priority = importance
+        node.accuracy = accuracy
+        if parent_id:
+            parent = self.topic_nodes.get(parent_id)
+        else:
+            parent = self.subject_nodes.get(subject_id)
+        self._attach(node, parent)
+
+    def remove_topic(self, topic_id: int):
+        self._structure_generation += 1
+        node = self.topic_nodes.pop(topic_id, None)
+        if node is None:
+            return
+        for material in node.inputs:
+            self.input_materials.pop(material.material_id, None)
+        for material in node.outputs:
+            self.output_materials.pop(material.material_id, None)
+        self._attach(node, None)
+
+    def upsert_material(self, kind: str, material_id: int, owner_type: str, owner_id: int, type_: str, title: str,
+                        required_hours: float, reviewed_hours: float, is_completed: bool):
+        self._structure_generation += 1
+        registry = self.input_materials if kind == 'input' else self.output_materials
+        material = registry.get(material_id)
+        node = self._owner_node(owner_type, owner_id)
+        if material is None:
+            if node is None:
+                return
+            material = Material(material_id, title, type_, required_hours, reviewed_hours, is_completed, owner_type, owner_id)
+            if kind == 'input':
+                node.add_input(material)
+            else:
+                node.add_output(material)
+            registry[material_id] = material
+        else:
+            material.title = title
+            material.type = type_
+            material.required_hours = required_hours
+            material.reviewed_hours = reviewed_hours
+            material.is_completed = is_completed
+        if node:
+            self._refresh_material_counts(node)
+
+    def remove_material(self, kind: str, material_id: int):
+        self._structure_generation += 1
+        registry = self.input_materials if kind == 'input' else self.output_materials
+        material = registry.pop(material_id, None)
+        if material is None:
+            return
+        node = self._owner_node(material.owner_type, material.owner_id)
+        if node:
+            if kind == 'input':
+                node.inputs.remove(material)
+            else:
+                node.outputs.remove(material)
+            self._refresh_material_counts(node)
+
+    @staticmethod
+    def _eligible(nodes: Iterable[DAGNode]) -> List[DAGNode]:
+        return [n for n in nodes if not n.is_completed and n.priority > 0]
+
+    def exam_candidates(self) -> List[DAGNode]:
+        """
+        可选的考试，按 id 排序。strict 模式下只含优先级最高的，轮转在它们之间进行；
+        fair 模式下为全部未完成的考试。
+        """
+        candidates = self._eligible(self.exam_nodes.values())
+        if candidates and self.selection == "strict":
+            max_priority = max(e.priority for e in candidates)
+            candidates = [e for e in candidates if e.priority == max_priority]
+        candidates.sort(key=lambda x: x.node_id)
+        return candidates
+
+    def subject_candidates(self, exam_node: DAGNode) -> List[DAGNode]:
+        candidates = self._eligible(exam_node.children)
+        if candidates and self.selection == "strict":
+            max_priority = max(s.priority for s in candidates)
+            candidates = [s for s in candidates if s.priority == max_priority]
+        candidates.sort(key=lambda x: x.node_id)
+        return candidates
+
     def select_next_exam(self) -> Optional[DAGNode]:
-        candidates = [e for e in self.exam_nodes.values() if not e.is_completed and e.priority > 0]
+        if self.selection == "fair":
+            next_exam = next(self._fair_exam_queue().ordered(), None)
+            if next_exam is not None:
+                self.last_exam_id = next_exam.node_id
+            return next_exam
+        candidates = self.exam_candidates()
         if not candidates:
             return None
-        max_priority = max(e.priority for e in candidates)
-        candidates = [e for e in candidates if e.priority == max_priority]
-        candidates.sort(key=lambda x: x.node_id)
         ids = [e.node_id for e in candidates]
         if self.last_exam_id and self.last_exam_id in ids:
             idx = ids.index(self.last_exam_id)
@@ -175,12 +700,14 @@ class DAG:
         return next_exam
 
     def select_next_subject(self, exam_node: DAGNode) -> Optional[DAGNode]:
-        candidates = [s for s in exam_node.children if not s.is_completed and s.priority > 0]
+        if self.selection == "fair":
+            next_subject = next(self._fair_subject_queue(exam_node).ordered(), None)
+            if next_subject is not None:
+                self.last_subject_id = next_subject.node_id
+            return next_subject
+        candidates = self.subject_candidates(exam_node)
         if not candidates:
             return None
-        max_priority = max(s.priority for s in candidates)
-        candidates = [s for s in candidates if s.priority == max_priority]
-        candidates.sort(key=lambda x: x.node_id)
         ids = [s.node_id for s in candidates]
         if self.last_subject_id and self.last_subject_id in ids:
             idx = ids.index(self.last_subject_id)
@@ -190,28 +717,191 @@ class DAG:
         self.last_subject_id = next_subject.node_id
         return next_subject
 
-    def get_next_task(self, exam_node: DAGNode, subject_node: Optional[DAGNode], types: Tuple[str], max_hours: float) -> Optional[Material]:
-        def dfs(node: DAGNode) -> Optional[Material]:
-            for material in node.inputs:
-                if not material.is_completed and material.type in types:
-                    if material.type == 'mock_exam' and material.required_hours > max_hours:
-                        continue
-                    return material
-            sorted_children = sorted(node.children, key=lambda n: (-n.priority, n.node_id))
-            for child in sorted_children:
-                result = dfs(child)
-                if result:
-                    return result
+    def candidate_pairs(self) -> Iterator[Tuple[DAGNode, Optional[DAGNode]]]:
+        """
+        一个子段内依次尝试的 (考试, 科目) 组合；每产出一个组合，轮转游标就移到这个组合上。
+
+        strict：按原来的轮转逐个选，组合重复时停止；
+        fair：按虚拟时间从小到大遍历所有组合，由 charge() 按实际分到的时长记账。
+        """
+        if self.selection == "fair":
+            for exam in self._fair_exam_queue().ordered():
+                self.last_exam_id = exam.node_id
+                subjects = self._fair_subject_queue(exam).ordered()
+                subj = next(subjects, None)
+                if subj is None:
+                    yield exam, None
+                while subj is not None:
+                    self.last_subject_id = subj.node_id
+                    yield exam, subj
+                    subj = next(subjects, None)
+            return
+
+        tried_pairs: set[tuple[int, int]] = set()
+        while True:
+            exam = self.select_next_exam()
+            if exam is None:
+                return
+            subj = self.select_next_subject(exam)
+            pair = (exam.node_id, subj.node_id if subj else -1)
+            if pair in tried_pairs:
+                return
+            tried_pairs.add(pair)
+            yield exam, subj
+
+    def charge(self, exam_node: DAGNode, subject_node: Optional[DAGNode], hours: float):
+        """把分配出去的学习时长记到考试和科目的虚拟时间上；只有 fair 模式需要。"""
+        if self.selection != "fair":
+            return
+        self._fair_exam_queue().charge(exam_node, hours)
+        if subject_node is not None:
+            self._fair_subject_queue(exam_node).charge(subject_node, hours)
+
+    def _sync_fair_queues(self):
+        # 结构变化或进度被恢复后，完成状态可能倒退，重建队列；调度中的材料完成由惰性失效处理
+        generation = (self._structure_generation, self._progress_generation)
+        if self._fair_generation != generation:
+            self._exam_queue = _FairQueue('exam', self._eligible(self.exam_nodes.values()), self.virtual_time)
+            self._subject_queues = {}
+            self._fair_generation = generation
+
+    def _fair_exam_queue(self) -> _FairQueue:
+        self._sync_fair_queues()
+        return self._exam_queue
+
+    def _fair_subject_queue(self, exam_node: DAGNode) -> _FairQueue:
+        self._sync_fair_queues()
+        queue = self._subject_queues.get(exam_node.node_id)
+        if queue is None:
+            queue = _FairQueue('subject', self._eligible(exam_node.children), self.virtual_time)
+            self._subject_queues[exam_node.node_id] = queue
+        return queue
+
+    def _sorted_children(self, node: DAGNode) -> List[DAGNode]:
+        if node.sorted_children_generation != self._structure_generation:
+            node.sorted_children = sorted(node.children, key=lambda n: (-n.priority, n.node_id))
+            node.sorted_children_generation = self._structure_generation
+        return node.sorted_children
+
+    @staticmethod
+    def _own_task(materials: List[Material], types: Tuple[str], max_hours: Optional[float]) -> Optional[Material]:
+        for material in materials:
+            if not material.is_completed and material.type in types:
+                if material.type == 'mock_exam' and material.required_hours > max_hours:
+                    continue
+                return material
+        return None
+
+    def _first_task(self, root: DAGNode, types: Tuple[str], max_hours: Optional[float], key: tuple) -> Optional[Material]:
+        """
+        深度优先：先看节点自己的输入材料，再依次进入子节点，子树都没有时才看输出材料。
+        每个节点的结果按 key 缓存。用显式栈，很深的知识点链也不会超出递归深度。
+        """
+        generation = (self._structure_generation, self._progress_generation)
+        # 栈帧：[节点, 子节点迭代器]；迭代器为 None 表示刚进入
+        stack = [[root, None]]
+        result = None                                 # 最近一个出栈节点的结果
+        while stack:
+            frame = stack[-1]
+            node, children = frame
+            if children is None:
+                if node.task_cache_generation != generation:
+                    node.task_cache.clear()
+                    node.task_cache_generation = generation
+                elif key in node.task_cache:
+                    result = node.task_cache[key]
+                    stack.pop()
+                    continue
+                result = self._own_task(node.inputs, types, max_hours)
+                if result is not None:
+                    node.task_cache[key] = result
+                    stack.pop()
+                    continue
+                children = frame[1] = iter(self._sorted_children(node))
+            elif result is not None:                  # 子树里找到了
+                node.task_cache[key] = result
+                stack.pop()
+                continue
+
+            child = next(children, None)
+            if child is not None:
+                stack.append([child, None])
+                continue
+            result = None
             if node.unfinished_children_count == 0 and node.unfinished_inputs_count == 0:
+                result = self._own_task(node.outputs, types, max_hours)
+            node.task_cache[key] = result
+            stack.pop()
+        return result
+
+    # ───────────── score 模式：按科目建打分索引，随学习进度增量维护 ─────────────
+    def _sync_score_indexes(self):
+        generation = (self._structure_generation, self._progress_generation)
+        if self._score_generation != generation:
+            self._score_indexes = {}
+            self._score_index_of = {}
+            self._score_generation = generation
+
+    def _score_index(self, subject_node: DAGNode) -> _ScoreIndex:
+        self._sync_score_indexes()
+        index = self._score_indexes.get(subject_node.node_id)
+        if index is None:
+            index = self._build_score_index(subject_node)
+            self._score_indexes[subject_node.node_id] = index
+        return index
+
+    def _build_score_index(self, subject_node: DAGNode) -> _ScoreIndex:
+        """一次遍历整棵子树：与 _first_task 相同的深度优先顺序（输入材料、子节点、输出材料）。"""
+        index = _ScoreIndex()
+        # (节点, 祖先优先级之和, 祖先个数, 是否已处理完子节点)
+        stack = [(subject_node, 0, 0, False)]
+        while stack:
+            node, path_sum, path_len, post = stack.pop()
+            ancestor_priority = path_sum / path_len if path_len else node.priority
+            if post:
                 for material in node.outputs:
-                    if not material.is_completed and material.type in types:
-                        if material.type == 'mock_exam' and material.required_hours > max_hours:
-                            continue
-                        return material
-            return None
+                    index.add(material, node.priority, node.accuracy, ancestor_priority)
+                    self._score_index_of[material] = index
+                self._score_index_of[node] = index
+                self._outputs_ready(node)
+                continue
+            for material in node.inputs:
+                index.add(material, node.priority, node.accuracy, ancestor_priority)
+                self._score_index_of[material] = index
+                if not material.is_completed:
+                    index.push(material)
+            stack.append((node, path_sum, path_len, True))
+            for child in reversed(self._sorted_children(node)):
+                stack.append((child, path_sum + node.priority, path_len + 1, False))
+        return index
+
+    def _outputs_ready(self, node: DAGNode):
+        """节点的子节点和输入材料都已完成时，把它的输出材料加入索引。"""
+        index = self._score_index_of.get(node)
+        if index is None or node in index.ready_nodes:
+            return
+        if node.unfinished_children_count == 0 and node.unfinished_inputs_count == 0:
+            index.ready_nodes.add(node)
+            for material in node.outputs:
+                if not material.is_completed:
+                    index.push(material)
+
+    def _rescore(self, material: Material):
+        self._sync_score_indexes()
+        index = self._score_index_of.get(material)
+        if index is None:
+            return
+        if material.is_input or self._owner_node(material.owner_type, material.owner_id) in index.ready_nodes:
+            index.push(material)
 
+    def get_next_task(self, exam_node: DAGNode, subject_node: Optional[DAGNode], types: Tuple[str], max_hours: float) -> Optional[Material]:
+        # max_hours 只对 mock_exam 起作用，其余类型组共用一份缓存
+        key = (types, max_hours if 'mock_exam' in types else None)
         if subject_node:
-            result = dfs(subject_node)
+            if self.task_order == "score":
+                result = self._score_index(subject_node).best(types, max_hours)
+            else:
+                result = self._first_task(subject_node, types, max_hours, key)
             if result:
                 return result
 
@@ -225,8 +915,9 @@ class DAG:
         return None
 
     def print_dag(self):
-        for exam_node in self.exam_nodes.values():
-            self._print_node(exam_node, indent=0)
+        for event, node, indent in walk(self.exam_nodes.values(), _children):
+            if event == ENTER:
+                self._print_node(node, indent)
 
     def _print_node(self, node: DAGNode, indent: int):
         prefix = "  " * indent
@@ -238,8 +929,6 @@ class DAG:
             print(f"{prefix}  Unfinished inputs: {node.unfinished_inputs_count}")
         if node.unfinished_outputs_count > 0:
             print(f"{prefix}  Unfinished outputs: {node.unfinished_outputs_count}")
-        for child in node.children:
-            self._print_node(child, indent + 1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,251 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date
+from typing import Callable, Iterator, List, Optional
+
+from .checkpoint import dump_checkpoint, load_checkpoint, load_snapshot, save_snapshot, snapshot_date
+from .dag import DAG
+
+Delta = Callable[[DAG], None]
+
+
+def read_revision(conn: sqlite3.Connection) -> int:
+    """读取数据库修订号；影响复习计划的表每改一行，触发器就把它加一。"""
+    row = conn.execute("SELECT revision FROM DbRevision WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+# ───────────── 把一行数据转成增量；行已不存在时转成删除 ─────────────
+def _chain(*deltas: Delta) -> Delta:
+    def apply(dag: DAG):
+        for delta in deltas:
+            delta(dag)
+    return apply
+
+
+def _adopt_deltas(conn: sqlite3.Connection, child_sql: str, child_delta, owner_type: str, owner_id: int) -> List[Delta]:
+    """
+    新建节点时，把库里已经指向它的子节点和输出材料一并挂上，
+    与整体重载时的结果保持一致（例如先建材料、后建其所属考试）。
+    """
+    deltas = [child_delta(conn, row[0]) for row in conn.execute(child_sql, (owner_id,))]
+    deltas += [
+        output_delta(conn, row[0])
+        for row in conn.execute(
+            "SELECT output_id FROM OutputMaterial WHERE owner_type = ? AND owner_id = ? ORDER BY output_id",
+            (owner_type, owner_id),
+        )
+    ]
+    return deltas
+
+
+def exam_delta(conn: sqlite3.Connection, exam_id: int, created: bool = False) -> Delta:
+    row = conn.execute(
+        "SELECT exam_name, priority FROM Exam WHERE exam_id = ?", (exam_id,)
+    ).fetchone()
+    if row is None:
+        return lambda dag: None
+    delta = lambda dag: dag.upsert_exam(exam_id, *row)
+    if created:
+        return _chain(delta, *_adopt_deltas(
+            conn,
+            "SELECT subject_id FROM Subject WHERE exam_id = ? ORDER BY subject_id",
+            subject_delta,
+            "exam",
+            exam_id,
+        ))
+    return delta
+
+
+def subject_delta(conn: sqlite3.Connection, subject_id: int, created: bool = False) -> Delta:
+    row = conn.execute(
+        "SELECT exam_id, subject_name, priority FROM Subject WHERE subject_id = ?",
+        (subject_id,),
+    ).fetchone()
+    if row is None:
+        return lambda dag: None
+    delta = lambda dag: dag.upsert_subject(subject_id, *row)
+    if created:
+        return _chain(delta, *_adopt_deltas(
+            conn,
+            "SELECT topic_id FROM TopicNode WHERE subject_id = ? AND (parent_id IS NULL OR parent_id = 0) ORDER BY topic_id",
+            topic_delta,
+            "subject",
+            subject_id,
+        ))
+    return delta
+
+
+def topic_delta(conn: sqlite3.Connection, topic_id: int, created: bool = False) -> Delta:
+    row = conn.execute(
+        "SELECT subject_id, parent_id, name, importance, accuracy FROM TopicNode WHERE topic_id = ?",
+        (topic_id,),
+    ).fetchone()
+    if row is None:
+        return lambda dag: dag.remove_topic(topic_id)
+    delta = lambda dag: dag.upsert_topic(topic_id, *row)
+    if created:
+        inputs = [
+            input_delta(conn, r[0])
+            for r in conn.execute(
+                "SELECT input_id FROM InputMaterial WHERE topic_id = ? ORDER BY input_id", (topic_id,)
+            )
+        ]
+        return _chain(delta, *inputs, *_adopt_deltas(
+            conn,
+            "SELECT topic_id FROM TopicNode WHERE parent_id = ? ORDER BY topic_id",
+            topic_delta,
+            "topic",
+            topic_id,
+        ))
+    return delta
+
+
+def input_delta(conn: sqlite3.Connection, input_id: int) -> Delta:
+    row = conn.execute(
+        """
+        SELECT topic_id, type, title, required_hours, reviewed_hours, is_completed
+        FROM InputMaterial WHERE input_id = ?
+    """,
+        (input_id,),
+    ).fetchone()
+    if row is None:
+        return lambda dag: dag.remove_material("input", input_id)
+    topic_id, type_, title, req_hrs, rev_hrs, is_completed = row
+    return lambda dag: dag.upsert_material(
+        "input", input_id, "topic", topic_id, type_, title, req_hrs, rev_hrs, bool(is_completed)
+    )
+
+
+def output_delta(conn: sqlite3.Connection, output_id: int) -> Delta:
+    row = conn.execute(
+        """
+        SELECT owner_type, owner_id, type, title, required_hours, reviewed_hours, is_completed
+        FROM OutputMaterial WHERE output_id = ?
+    """,
+        (output_id,),
+    ).fetchone()
+    if row is None:
+        return lambda dag: dag.remove_material("output", output_id)
+    owner_type, owner_id, type_, title, req_hrs, rev_hrs, is_completed = row
+    return lambda dag: dag.upsert_material(
+        "output", output_id, owner_type, owner_id, type_, title, req_hrs, rev_hrs, bool(is_completed)
+    )
+
+
+class DAGStore:
+    """
+    每个进程常驻一份 DAG。
+
+    写接口通过 write() 在同一事务里记录增量，提交后直接应用到常驻 DAG；
+    如果期间有外部写入（修订号对不上），就丢弃常驻 DAG，下次使用时整体重载。
+    重载时若有同一修订号的每日快照，就从快照恢复，不再逐表读取。
+    """
+
+    def __init__(self, db_path: str, selection: str = "strict", task_order: str = "first"):
+        self.db_path = db_path
+        self.selection = selection
+        self.task_order = task_order
+        self._dag: Optional[DAG] = None
+        self._revision: Optional[int] = None
+        # 调度会临时修改 DAG，借出期间独占；借出期间不要等客户端 I/O（接口先算完结果再响应），否则写接口会被挡住
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+        self.reload_count = 0
+        self.snapshot_restore_count = 0
+
+    def add_listener(self, listener: Callable[[], None]):
+        """注册写入提交后的回调（例如通知后台重排）。"""
+        self._listeners.append(listener)
+
+    @property
+    def revision(self) -> Optional[int]:
+        """常驻 DAG 对应的数据库修订号；在 checkout() 内读取才有意义。"""
+        return self._revision
+
+    def _reload(self):
+        with sqlite3.connect(self.db_path) as conn:
+            # 修订号和 DAG 在同一个读事务里读取，保证两者对应同一份数据
+            conn.execute("BEGIN")
+            self._revision = read_revision(conn)
+            self._dag = self._restore_snapshot(conn) or DAG(
+                self.db_path, conn=conn, selection=self.selection, task_order=self.task_order
+            )
+        self.reload_count += 1
+
+    def _restore_snapshot(self, conn: sqlite3.Connection) -> Optional[DAG]:
+        blob = load_snapshot(conn, self._revision)
+        if blob is None:
+            return None
+        try:
+            dag = load_checkpoint(blob, self.db_path).dag
+        except ValueError as e:
+            print(f"⚠️ DAG 快照无法恢复，改为从数据库加载: {e}")
+            return None
+        dag.selection = self.selection
+        dag.task_order = self.task_order
+        self.snapshot_restore_count += 1
+        return dag
+
+    def save_daily_snapshot(self) -> bool:
+        """若今天还没有快照、且常驻 DAG 与数据库一致，就写入一份；返回是否写入。"""
+        with self._lock:
+            if self._dag is None:
+                return False
+            with sqlite3.connect(self.db_path) as conn:
+                if snapshot_date(conn) == date.today().isoformat() or read_revision(conn) != self._revision:
+                    return False
+                # 持锁期间没有借出，DAG 停在数据库中的进度上
+                save_snapshot(conn, dump_checkpoint(self._dag, self._revision), self._revision)
+        return True
+
+    def _current(self) -> DAG:
+        """持锁时调用：返回与数据库一致的常驻 DAG，必要时重载。"""
+        with sqlite3.connect(self.db_path) as conn:
+            revision = read_revision(conn)
+        if self._dag is None or self._revision != revision:
+            self._reload()
+        return self._dag
+
+    @contextmanager
+    def checkout(self) -> Iterator[DAG]:
+        """独占借出与数据库一致的 DAG；调用方对进度的修改在归还时撤销。不要在 with 块里 yield 给响应流。"""
+        with self._lock:
+            dag = self._current()
+            progress = dag.save_progress()
+            try:
+                yield dag
+            finally:
+                dag.restore_progress(progress)
+
+    @contextmanager
+    def view(self) -> Iterator[DAG]:
+        """只读借出：调用方不得修改 DAG，因此省去保存 / 恢复进度。"""
+        with self._lock:
+            yield self._current()
+
+    @contextmanager
+    def write(self, conn: sqlite3.Connection) -> Iterator[List[Delta]]:
+        """
+        在 conn 上开启写事务，调用方把增量追加到产出的列表里。
+
+        事务提交后，若常驻 DAG 正好停在本次写入之前的修订号，就应用增量；
+        否则说明漏掉了别的写入，标记失效等待重载。
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        before = read_revision(conn)
+        deltas: List[Delta] = []
+        yield deltas
+        after = read_revision(conn)
+        conn.commit()
+
+        with self._lock:
+            if self._dag is not None and self._revision != before:
+                self._dag = None
+            if self._dag is not None:
+                for delta in deltas:
+                    delta(self._dag)
+                self._revision = after
+        for listener in self._listeners:
+            listener()
@@ -0,0 +1,112 @@
+import sqlite3
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+# 输出材料：每小时 (1/0.6) × accuracy；输入材料：每小时 1 EXP
+OUTPUT_EXP_FACTOR = 1 / 0.6
+
+# 单条日志的 EXP（l = ReviewTaskLog，o = LEFT JOIN 的 OutputMaterial）。
+# 既有输入又有输出的日志按输入计；输出材料未完成或无准确率时不计分。
+EXP_SQL = f"""
+    CASE
+        WHEN l.input_material_id IS NOT NULL
+            THEN COALESCE(l.duration_minutes, 0) / 60.0
+        WHEN o.is_completed AND o.accuracy IS NOT NULL
+            THEN COALESCE(l.duration_minutes, 0) / 60.0 * {OUTPUT_EXP_FACTOR!r} * o.accuracy
+        ELSE 0
+    END
+"""
+
+# 时间粒度 -> 分桶表达式（d = ReviewDailyStats），统一用桶的第一天表示（周从周一开始）
+BUCKET_SQL: Dict[str, str] = {
+    "day": "d.date",
+    "week": "date(d.date, 'weekday 0', '-6 days')",
+    "month": "strftime('%Y-%m-01', d.date)",
+}
+
+# 每日汇总行的 EXP：输入材料每小时 1 EXP，输出材料的 EXP 已由触发器累加在 output_exp 中
+DAILY_EXP_SQL = "d.input_minutes / 60.0 + d.output_exp"
+
+
+def read_total_exp(conn: sqlite3.Connection) -> float:
+    """从 ExpLedger 读取累计 EXP，O(1)；账本缺失时先重建。"""
+    row = conn.execute(
+        "SELECT input_minutes, output_exp FROM ExpLedger WHERE id = 1"
+    ).fetchone()
+    if row is None:
+        return rebuild_exp_ledger(conn)
+    input_minutes, output_exp = row
+    return input_minutes / 60.0 + output_exp
+
+
+def rebuild_exp_ledger(conn: sqlite3.Connection) -> float:
+    """按全部 ReviewTaskLog 重新计算 ExpLedger，返回重建后的累计 EXP。"""
+    conn.execute(
+        f"""
+        INSERT OR REPLACE INTO ExpLedger (id, input_minutes, output_exp)
+        SELECT 1,
+            COALESCE(SUM(CASE WHEN l.input_material_id IS NOT NULL
+                THEN COALESCE(l.duration_minutes, 0) END), 0),
+            COALESCE(SUM(CASE WHEN l.input_material_id IS NULL THEN {EXP_SQL} END), 0)
+        FROM ReviewTaskLog l
+        LEFT JOIN OutputMaterial o ON o.output_id = l.output_material_id
+    """
+    )
+    conn.commit()
+    return read_total_exp(conn)
+
+
+def _bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _next_bucket(start: date, bucket: str) -> date:
+    if bucket == "week":
+        return start + timedelta(days=7)
+    if bucket == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def exp_history(
+    conn: sqlite3.Connection, date_from: date, date_to: date, bucket: str = "day"
+) -> List[Dict[str, Any]]:
+    """
+    统计 [date_from, date_to] 内每个时间桶获得的 EXP 及窗口内累计值。
+
+    读取每日汇总 ReviewDailyStats，开销与天数成正比；没有记录的桶补 0。
+    """
+    if bucket not in BUCKET_SQL:
+        raise ValueError(f"unknown bucket: {bucket}")
+
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT {BUCKET_SQL[bucket]} AS period, SUM({DAILY_EXP_SQL})
+        FROM ReviewDailyStats d
+        WHERE d.date BETWEEN ? AND ?
+        GROUP BY period
+    """,
+        (date_from.isoformat(), date_to.isoformat()),
+    )
+    exp_by_period = dict(cursor.fetchall())
+
+    points = []
+    running_total = 0.0
+    period = _bucket_start(date_from, bucket)
+    while period <= date_to:
+        exp = exp_by_period.get(period.isoformat()) or 0.0
+        running_total += exp
+        points.append(
+            {
+                "date": period.isoformat(),
+                "exp": round(exp, 2),
+                "cumulative_exp": round(running_total, 2),
+            }
+        )
+        period = _next_bucket(period, bucket)
+    return points
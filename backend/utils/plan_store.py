@@ -0,0 +1,139 @@
+import asyncio
+import sqlite3
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# 只保留最近几个版本，读请求总能读到完整的最新版本
+KEEP_PLAN_VERSIONS = 2
+
+
+def save_plan(
+    conn: sqlite3.Connection,
+    plan: List[Dict[str, Any]],
+    db_revision: int,
+    start_date: str,
+    start_time: str,
+    end_date: str,
+) -> int:
+    """把 schedule_review 生成的计划写成新版本，返回版本号。"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        INSERT INTO PlanVersion (db_revision, start_date, start_time, end_date, generated_at)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+        (db_revision, start_date, start_time, end_date, datetime.now().isoformat(timespec="seconds")),
+    )
+    version = cursor.lastrowid
+    cursor.executemany(
+        """
+        INSERT INTO ScheduledSlot (
+            plan_version, date, start_time, end_time, slot_type, task_id, task_title
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    """,
+        [
+            (version, row["date"], row["start"], row["end"], row["slot_type"], row["task_id"], row["task_title"])
+            for row in plan
+        ],
+    )
+    cursor.execute(
+        "DELETE FROM ScheduledSlot WHERE plan_version <= ?", (version - KEEP_PLAN_VERSIONS,)
+    )
+    cursor.execute(
+        "DELETE FROM PlanVersion WHERE version <= ?", (version - KEEP_PLAN_VERSIONS,)
+    )
+    conn.commit()
+    return version
+
+
+def load_latest_meta(conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+    row = conn.execute(
+        """
+        SELECT version, db_revision, start_date, start_time, end_date, generated_at
+        FROM PlanVersion ORDER BY version DESC LIMIT 1
+    """
+    ).fetchone()
+    if row is None:
+        return None
+    keys = ("version", "db_revision", "start_date", "start_time", "end_date", "generated_at")
+    return dict(zip(keys, row))
+
+
+def load_plan_rows(
+    conn: sqlite3.Connection, version: int, from_date: str, from_time: str, to_date: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """读取某个版本中尚未结束的时间段（按索引做范围查询），可选截止到 to_date（含）。"""
+    sql = """
+        SELECT date, start_time, end_time, slot_type, task_id, task_title
+        FROM ScheduledSlot
+        WHERE plan_version = ? AND date >= ? AND (date > ? OR end_time > ?)
+    """
+    params: List[Any] = [version, from_date, from_date, from_time]
+    if to_date is not None:
+        sql += " AND date <= ?"
+        params.append(to_date)
+    cursor = conn.cursor()
+    cursor.execute(sql + " ORDER BY date, start_time", params)
+    return [
+        {
+            "date": row[0],
+            "start": row[1],
+            "end": row[2],
+            "slot_type": row[3],
+            "task_id": row[4],
+            "task_title": row[5],
+        }
+        for row in cursor.fetchall()
+    ]
+
+
+class PlanRefresher:
+    """
+    FastAPI 进程内的后台重排任务。
+
+    写接口调用 notify()；一连串编辑会被防抖合并成一次重排。
+    另外每隔 poll_interval 秒醒来一次，处理外部写入和时间推移。
+    """
+
+    def __init__(
+        self,
+        is_stale: Callable[[], bool],
+        refresh: Callable[[], None],
+        debounce: float = 2.0,
+        poll_interval: float = 60.0,
+    ):
+        self.is_stale = is_stale
+        self.refresh = refresh
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.refresh_count = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+
+    def notify(self):
+        """可在任意线程调用。"""
+        if self._loop is not None and self._event is not None:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        self._event.set()  # 启动后先检查一次
+        while True:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            # 防抖：在 debounce 秒内持续有新通知就继续等
+            while True:
+                self._event.clear()
+                try:
+                    await asyncio.wait_for(self._event.wait(), timeout=self.debounce)
+                except asyncio.TimeoutError:
+                    break
+            try:
+                if await asyncio.to_thread(self.is_stale):
+                    await asyncio.to_thread(self.refresh)
+                    self.refresh_count += 1
+            except Exception as e:  # 后台任务不能因为一次失败而退出
+                print(f"⚠️ 复习计划重排失败: {e}")
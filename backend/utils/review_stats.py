@@ -0,0 +1,94 @@
+import sqlite3
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from .exp import EXP_SQL
+
+# ReviewDailyStats：按 (日期, 节点类型) 汇总的复习记录，由 ReviewTaskLog / OutputMaterial 上的触发器增量维护。
+# 连续打卡、日历、EXP 曲线都读这张表，开销与天数成正比，与日志条数无关。
+# input_minutes / output_minutes 的划分与 EXP 一致：既有输入又有输出的日志按输入计。
+
+# 从全部日志重新汇总（迁移回填和 rebuild_daily_stats 共用）
+DAILY_STATS_BACKFILL = f"""
+INSERT INTO ReviewDailyStats (date, node_type, minutes, input_minutes, output_minutes, output_exp, log_count)
+SELECT l.reviewed_at, l.node_type,
+    SUM(COALESCE(l.duration_minutes, 0)),
+    SUM(CASE WHEN l.input_material_id IS NOT NULL THEN COALESCE(l.duration_minutes, 0) ELSE 0 END),
+    SUM(CASE WHEN l.input_material_id IS NULL AND l.output_material_id IS NOT NULL
+        THEN COALESCE(l.duration_minutes, 0) ELSE 0 END),
+    SUM(CASE WHEN l.input_material_id IS NULL THEN {EXP_SQL} ELSE 0 END),
+    COUNT(*)
+FROM ReviewTaskLog l
+LEFT JOIN OutputMaterial o ON o.output_id = l.output_material_id
+GROUP BY l.reviewed_at, l.node_type;
+"""
+
+# 计入连续打卡的日子：当天有知识点层级的复习且时长大于 0
+_STREAK_DAYS = "SELECT date FROM ReviewDailyStats WHERE node_type = 'topic' AND minutes > 0"
+
+
+def rebuild_daily_stats(conn: sqlite3.Connection) -> int:
+    """按全部 ReviewTaskLog 重建 ReviewDailyStats，返回汇总出的行数。"""
+    conn.execute("DELETE FROM ReviewDailyStats")
+    conn.execute(DAILY_STATS_BACKFILL)
+    conn.commit()
+    return conn.execute("SELECT COUNT(*) FROM ReviewDailyStats").fetchone()[0]
+
+
+def current_streak(conn: sqlite3.Connection, today: date) -> int:
+    """截至 today（含）的连续打卡天数；today 没有复习时为 0。只读取连续段内的几天。"""
+    streak = 0
+    expected = today
+    cursor = conn.execute(f"{_STREAK_DAYS} AND date <= ? ORDER BY date DESC", (today.isoformat(),))
+    for (day,) in cursor:
+        if day != expected.isoformat():
+            break
+        streak += 1
+        expected -= timedelta(days=1)
+    return streak
+
+
+def streak_summary(conn: sqlite3.Connection, today: date) -> Dict[str, Any]:
+    """当前连续天数、历史最长连续天数和最近一次打卡日期。"""
+    longest = run = 0
+    previous: Optional[date] = None
+    for (day,) in conn.execute(f"{_STREAK_DAYS} ORDER BY date"):
+        current = date.fromisoformat(day)
+        run = run + 1 if previous is not None and current - previous == timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = current
+    return {
+        "current_streak": current_streak(conn, today),
+        "longest_streak": longest,
+        "last_review_date": previous.isoformat() if previous else None,
+    }
+
+
+def review_calendar(conn: sqlite3.Connection, date_from: date, date_to: date) -> List[Dict[str, Any]]:
+    """[date_from, date_to] 内每天的复习分钟数和记录数（各节点类型合计），没有记录的日子补 0。"""
+    cursor = conn.execute(
+        """
+        SELECT date, SUM(minutes), SUM(input_minutes), SUM(output_minutes), SUM(log_count)
+        FROM ReviewDailyStats
+        WHERE date BETWEEN ? AND ?
+        GROUP BY date
+    """,
+        (date_from.isoformat(), date_to.isoformat()),
+    )
+    by_day = {row[0]: row[1:] for row in cursor}
+
+    days = []
+    day = date_from
+    while day <= date_to:
+        minutes, input_minutes, output_minutes, log_count = by_day.get(day.isoformat(), (0, 0, 0, 0))
+        days.append(
+            {
+                "date": day.isoformat(),
+                "minutes": minutes,
+                "input_minutes": input_minutes,
+                "output_minutes": output_minutes,
+                "log_count": log_count,
+            }
+        )
+        day += timedelta(days=1)
+    return days
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
-from itertools import groupby
-from typing import List, Dict, Any, Tuple, Optional
+from array import array
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from .dag import DAG
 from .dag import Material
-from .time_slot import get_available_slots
+from .time_slot import (MINUTES_PER_DAY, format_day, format_hhmm, get_available_slots,
+                        parse_day, parse_hhmm)
 
 
 # ────────────────────────────────────────────────────────────
@@ -19,109 +20,420 @@ _ALLOWED_TYPES: Dict[str, Tuple[str, ...]] = {
 }
 
 
-def _split_to_30min_slots(slot: Dict[str, str]) -> List[Dict[str, str]]:
-    """把一个大段切成若干 30 min 子段。"""
-    start_dt = datetime.strptime(f"{slot['date']} {slot['start']}", "%Y-%m-%d %H:%M")
-    end_dt   = datetime.strptime(f"{slot['date']} {slot['end']}",   "%Y-%m-%d %H:%M")
+class _Segments:
+    """
+    30 min 子段，按开始时间排序。
+
+    时间都是自 1970-01-01 起的整数分钟，存放在两个紧凑数组里；
+    切分、判断首尾相接、计算时长都只是整数运算，只有输出计划行时才格式化成字符串。
+    """
+
+    __slots__ = ("start", "end", "source", "offset")
+
+    def __init__(self, source: Optional[Iterator[Tuple[int, int]]] = None, offset: int = 0):
+        self.start = array("q")
+        self.end = array("q")
+        # 惰性模式：按需从按时间排序的 (start, end) 大段里继续切分
+        self.source = source
+        # 第 0 段在整个计划期里的下标；从游标续排时不为 0，日内节奏按全局下标计算
+        self.offset = offset
+
+    def __len__(self) -> int:
+        """已切分出的子段数；惰性模式下需要先 load_all()。"""
+        return len(self.start)
+
+    def append_slot(self, start: int, end: int):
+        while start < end:
+            sub_end = min(start + 30, end)
+            self.start.append(start)
+            self.end.append(sub_end)
+            start = sub_end
+
+    def has(self, i: int) -> bool:
+        """第 i 段是否存在；惰性模式下按需切分。"""
+        while i >= len(self.start) and self.source is not None:
+            slot = next(self.source, None)
+            if slot is None:
+                self.source = None
+            else:
+                self.append_slot(*slot)
+        return i < len(self.start)
+
+    def indices_from(self, i: int) -> Iterator[int]:
+        while self.has(i):
+            yield i
+            i += 1
+
+    def load_all(self) -> "_Segments":
+        if self.source is not None:
+            for slot in self.source:
+                self.append_slot(*slot)
+            self.source = None
+        return self
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, _Segments) and self.start == other.start and self.end == other.end
+
+    def contiguous(self, k: int) -> bool:
+        """第 k 段与第 k+1 段在同一天且首尾相接。"""
+        nxt = self.start[k + 1]
+        return self.end[k] == nxt and self.start[k] // MINUTES_PER_DAY == nxt // MINUTES_PER_DAY
+
+    def hours(self, first: int, last: int) -> float:
+        """第 first..last 段（连续）的总时长（小时）。"""
+        return (self.end[last] - self.start[first]) / 60.0
+
+    def row(self, first: int, last: int, slot_type: str, task: Material) -> Dict[str, Any]:
+        start = self.start[first]
+        base = start // MINUTES_PER_DAY * MINUTES_PER_DAY
+        return {
+            "date":  _format_day(start // MINUTES_PER_DAY),
+            "start": format_hhmm(start - base),
+            "end":   format_hhmm(self.end[last] - base),
+            "slot_type": slot_type,
+            "task_id":    task.material_id,
+            "task_title": task.title,
+        }
+
+
+@lru_cache(maxsize=1024)
+def _format_day(day: int) -> str:
+    return format_day(day)
+
+
+TimeSlots = Union[List[Dict[str, str]], Tuple[array, array]]
+
+
+def _slot_minutes(slot: Union[Dict[str, str], Tuple[int, int]]) -> Tuple[int, int]:
+    if isinstance(slot, dict):
+        base = parse_day(slot["date"]) * MINUTES_PER_DAY
+        return base + parse_hhmm(slot["start"]), base + parse_hhmm(slot["end"])
+    return slot
+
+
+def _split_all(time_slots: TimeSlots) -> _Segments:
+    """
+    把各个大段切成 30 min 子段。
+
+    time_slots 可以是 get_available_slots 的字典列表，
+    也可以是 get_available_minutes 返回的 (starts, ends)，后者省去字符串解析。
+    """
+    if isinstance(time_slots, tuple):
+        bounds = sorted(zip(*time_slots))
+    else:
+        bounds = sorted(_slot_minutes(slot) for slot in time_slots)
 
-    subs = []
-    while start_dt < end_dt:
-        sub_end = min(start_dt + timedelta(minutes=30), end_dt)
-        subs.append(
-            {
-                "date": slot["date"],
-                "start": start_dt.strftime("%H:%M"),
-                "end":   sub_end.strftime("%H:%M"),
-            }
-        )
-        start_dt = sub_end
-    return subs
+    segs = _Segments()
+    for start, end in bounds:
+        segs.append_slot(start, end)
+    return segs
 
 
-def _are_contiguous(a: Dict[str, str], b: Dict[str, str]) -> bool:
-    """判断两个 30 min 段在同一天且首尾相接。"""
-    return (
-        a["date"] == b["date"]
-        and a["end"] == b["start"]
-    )
+# ───────────────────── 逐段检查点 ──────────────────────
+class ScheduleTrace:
+    """
+    schedule_review 的逐段检查点，供增量重排复用未受影响的前缀。
+
+    每个实际开始处理的子段 i 记录 (当时 plan 的长度, last_exam_id, last_subject_id)；
+    DAG 进度不逐段拷贝，而是由起点状态加上前缀各行的 update_task 重放得到。
+    """
+
+    def __init__(self, dag: "DAG", segs: _Segments):
+        self.segs = segs
+        self.base_states = dag.material_states()
+        self.base_signature = dag.structure_signature()
+        self.base_cursors = (dag.last_exam_id, dag.last_subject_id)
+        self.selection = dag.selection
+        self.task_order = dag.task_order
+        self.checkpoints: Dict[int, Tuple[int, Optional[int], Optional[int]]] = {}
+        self.plan: List[Dict[str, Any]] = []
+        self.row_segs: List[int] = []                       # 每行起始子段下标
+        self.row_materials: List[Tuple[str, int]] = []      # 每行对应的 (kind, material_id)
+        self.row_hours: List[float] = []                    # 每行计入 update_task 的时长
+
+    def first_row_of(self, key: Tuple[str, int]) -> Optional[int]:
+        for row_idx, row_key in enumerate(self.row_materials):
+            if row_key == key:
+                return row_idx
+        return None
+
+
+class _ExhaustionMemo:
+    """
+    在当前完成状态下已知排不出任务的记录；DAG 有材料完成时整体作废。
+
+    exhausted:   (exam_id, subject_id, slot_type, max_h) 组合，get_next_task 必然返回 None
+    empty_slots: 空置子段的游标变化 {(base_idx, 连续子段数, last_exam_id, last_subject_id): 结束时的游标}
+    """
+
+    def __init__(self, dag: "DAG"):
+        self.dag = dag
+        self.epoch = dag.completion_epoch
+        self.exhausted: set[tuple] = set()
+        self.empty_slots: Dict[tuple, Tuple[Optional[int], Optional[int]]] = {}
+
+    def sync(self):
+        if self.dag.completion_epoch != self.epoch:
+            self.epoch = self.dag.completion_epoch
+            self.exhausted.clear()
+            self.empty_slots.clear()
+
+    def next_task(self, exam, subj, slot_type: str, allow: Tuple[str, ...], max_h: float) -> Optional[Material]:
+        key = (exam.node_id, subj.node_id if subj else -1, slot_type, max_h)
+        if key in self.exhausted:
+            return None
+        task = self.dag.get_next_task(exam, subj, allow, max_h)
+        if task is None:
+            self.exhausted.add(key)
+        return task
+
+
+def _holds_rotation(dag: "DAG", memo: _ExhaustionMemo, exam, subj, slot_type: str) -> bool:
+    """
+    考试、科目都只有唯一候选，且另外两种 slot_type 都排不出任务时，
+    在所选材料完成之前，后续每个子段逐段调度都会选中同一材料。
+    """
+    if subj is None or len(dag.exam_candidates()) != 1 or len(dag.subject_candidates(exam)) != 1:
+        return False
+    for other in _DAY_CYCLE:
+        if other == slot_type:
+            continue
+        max_h = 2.0 if other == "output" else 0.5      # output 窗口最长 2 h；更短的窗口只会更难排
+        if memo.next_task(exam, subj, other, _ALLOWED_TYPES[other], max_h):
+            return False
+    return True
 
 
-def _slot_hours(seg_list: List[Dict[str, str]]) -> float:
-    """计算若干连续子段总时长（小时）。"""
-    t0 = datetime.strptime(f"{seg_list[0]['date']} {seg_list[0]['start']}", "%Y-%m-%d %H:%M")
-    t1 = datetime.strptime(f"{seg_list[-1]['date']} {seg_list[-1]['end']}",  "%Y-%m-%d %H:%M")
-    return (t1 - t0).total_seconds() / 3600.0
+def _contiguous_run(segs: _Segments, i: int, limit: int = 4) -> int:
+    """从 segs[i] 起首尾相接的子段数，最多 limit 个。"""
+    n = 1
+    while n < limit and segs.has(i + n) and segs.contiguous(i + n - 1):
+        n += 1
+    return n
 
 
 # ───────────────────── 核心调度 ──────────────────────
-def schedule_review(dag: "DAG", time_slots: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+def schedule_review(dag: "DAG", time_slots: TimeSlots, block: bool = True) -> List[Dict[str, Any]]:
+    """
+    block=True 时，轮转不会换人的连续子段一次分配给同一材料（只调用一次 update_task）；
+    block=False 逐个 30 min 子段调度。两种模式生成的计划完全一致。
+    """
     # 1) 切 30 min 子段
-    segs = []
-    for s in sorted(time_slots, key=lambda x: (x["date"], x["start"])):
-        segs.extend(_split_to_30min_slots(s))
+    segs = _split_all(time_slots)
+    return _run_schedule(dag, segs, 0, [], None, block)
 
-    plan, i = [], 0
-    while i < len(segs):
-        base_idx = (_DAY_CYCLE.index("passive")       # 先用当天循环起点
-                    + i) % 3                          # 保持日内节奏一致
-        consumed = False                              # 该 slot 是否成功分配
 
-        tried_pairs: set[tuple[int, int]] = set()     # (exam_id, subject_id) 已试过
+def iter_schedule(dag: "DAG", time_slots: Iterable, block: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    schedule_review 的惰性版本：边切分时间段边产出计划行，调用方可以随时停止。
+
+    time_slots 须已按时间排序，元素可以是 iter_available_slots 的字典，
+    也可以是 iter_available_minutes 的 (start, end)。
+    产出过程中会修改 dag 的进度，调用方应在 DAGStore.checkout() 内消费。
+    """
+    segs = _Segments(_slot_minutes(slot) for slot in time_slots)
+    return (row for _, row in _iter_rows(dag, segs, 0, 0, None, block))
+
+
+def iter_schedule_resumable(
+    dag: "DAG", time_slots: Iterable, seg_offset: int = 0
+) -> Iterator[Tuple[Dict[str, Any], Optional[Tuple[int, int]]]]:
+    """
+    逐段模式的惰性排程，每行附带续排位置 (下一子段的全局下标, 下一子段开始的纪元分钟)，
+    没有后续子段时为 None。
+
+    每产出一行时 dag 的进度恰好停在这一行之后，所以可以在任意行边界导出状态、
+    之后从续排位置接着排；整块分配会一次计入多行的进度，因此这里不用。
+    从游标续排时，time_slots 应从续排位置的开始分钟起，seg_offset 为其全局下标。
+    """
+    segs = _Segments((_slot_minutes(slot) for slot in time_slots), offset=seg_offset)
+    for next_i, row in _iter_rows(dag, segs, 0, 0, None, block=False):
+        resume = (seg_offset + next_i, segs.start[next_i]) if segs.has(next_i) else None
+        yield row, resume
+
+
+def reschedule_review(
+    dag: "DAG", time_slots: TimeSlots, previous: Optional[ScheduleTrace] = None
+) -> Tuple[List[Dict[str, Any]], ScheduleTrace]:
+    """
+    在 previous 的基础上重排，返回 (plan, 本次的检查点)；plan 与 schedule_review 完全一致。
 
-        while True:                                   # 在当前 30 min 内遍历 exam/subject
-            exam = dag.select_next_exam()
-            if exam is None:               # 全部完成
-                return plan
+    只有结构未变、仅有未完成材料的已学时长变化时才复用前缀：
+    这类材料在被第一次分配之前不影响任何选择，所以从它第一次出现的时间段开始重排。
+    其余情况（时间段变化、材料完成状态变化、结构变化）整体重排。
+    """
+    segs = _split_all(time_slots)
+    trace = ScheduleTrace(dag, segs)
+
+    resume_seg = _resume_point(previous, trace) if previous is not None else None
+    if resume_seg is None:
+        return _run_schedule(dag, segs, 0, trace.plan, trace), trace
+
+    if resume_seg == len(segs):
+        # 变化的材料从未被排到，计划不变
+        plan_len = len(previous.plan)
+        trace.checkpoints = dict(previous.checkpoints)
+    else:
+        plan_len, last_exam_id, last_subject_id = previous.checkpoints[resume_seg]
+        trace.checkpoints = {i: cp for i, cp in previous.checkpoints.items() if i < resume_seg}
+    trace.plan.extend(previous.plan[:plan_len])
+    trace.row_segs = previous.row_segs[:plan_len]
+    trace.row_materials = previous.row_materials[:plan_len]
+    trace.row_hours = previous.row_hours[:plan_len]
+    if resume_seg == len(segs):
+        return trace.plan, trace
+
+    # 复用前缀：重放前缀各行的学习进度，再恢复当时的轮转游标
+    for key, hours in zip(trace.row_materials, trace.row_hours):
+        dag.update_task(dag.material_by_key(key), hours)
+    dag.last_exam_id, dag.last_subject_id = last_exam_id, last_subject_id
+    return _run_schedule(dag, segs, resume_seg, trace.plan, trace), trace
+
+
+def _resume_point(previous: ScheduleTrace, trace: ScheduleTrace) -> Optional[int]:
+    """返回可以开始重排的子段下标；None 表示需要整体重排。"""
+    if (
+        trace.selection == "fair"          # 虚拟时间没有逐段记录，无法恢复到中途
+        or trace.task_order == "score"     # 已学时长直接影响得分，改动会立即改变选择
+        or (previous.selection, previous.task_order) != (trace.selection, trace.task_order)
+        or previous.segs != trace.segs
+        or previous.base_signature != trace.base_signature
+        or previous.base_cursors != trace.base_cursors
+        or previous.base_states.keys() != trace.base_states.keys()
+    ):
+        return None
+    resume_seg = len(trace.segs)
+    for key, (reviewed, completed) in trace.base_states.items():
+        old_reviewed, old_completed = previous.base_states[key]
+        if reviewed == old_reviewed and completed == old_completed:
+            continue
+        if completed or old_completed:
+            return None
+        row_idx = previous.first_row_of(key)
+        if row_idx is not None:
+            resume_seg = min(resume_seg, previous.row_segs[row_idx])
+    return resume_seg
+
+
+def _run_schedule(dag: "DAG", segs: _Segments, i: int, plan: List[Dict[str, Any]],
+                  trace: Optional[ScheduleTrace], block: bool = True) -> List[Dict[str, Any]]:
+    plan.extend(row for _, row in _iter_rows(dag, segs, i, len(plan), trace, block))
+    return plan
 
-            subj = dag.select_next_subject(exam)
 
-            subj_id = subj.node_id if subj else -1
-            if (exam.node_id, subj_id) in tried_pairs:
-                break                      # 所有 (exam, subject) 组合都试过
-            tried_pairs.add((exam.node_id, subj_id))
+def _iter_rows(dag: "DAG", segs: _Segments, i: int, emitted: int,
+               trace: Optional[ScheduleTrace], block: bool) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    从第 i 段开始调度，逐行产出 (该行之后的下一个子段下标, 行)；
+    emitted 为此前已产出的行数（用于检查点）。
+    """
+    memo = _ExhaustionMemo(dag)
+    while segs.has(i):
+        if trace is not None:
+            trace.checkpoints[i] = (emitted, dag.last_exam_id, dag.last_subject_id)
+        base_idx = (_DAY_CYCLE.index("passive")       # 先用当天循环起点
+                    + segs.offset + i) % 3            # 保持日内节奏一致
+        consumed = False                              # 该 slot 是否成功分配
 
+        # 完成状态没变时，同样的游标和窗口必然再次空置：直接套用上次的游标变化
+        memo.sync()
+        run_len = _contiguous_run(segs, i)
+        slot_key = (base_idx, run_len, dag.last_exam_id, dag.last_subject_id)
+        if slot_key in memo.empty_slots:
+            dag.last_exam_id, dag.last_subject_id = memo.empty_slots[slot_key]
+            i += 1
+            continue
+
+        tried_any = False
+        for exam, subj in dag.candidate_pairs():      # 在当前 30 min 内遍历 exam/subject
+            tried_any = True
             # -------- 尝试 3 种 slot_type --------
             for shift in range(3):
                 slot_type = _DAY_CYCLE[(base_idx + shift) % 3]
                 allow     = _ALLOWED_TYPES[slot_type]
 
                 if slot_type in ("passive", "active"):
-                    window   = [segs[i]]
+                    window   = 1
                     max_h    = 0.5
-                    task = dag.get_next_task(exam, subj, allow, max_h)
+                    task = memo.next_task(exam, subj, slot_type, allow, max_h)
 
                 else:   # output —— 逐段延长，≤2 h
-                    task, window = None, []
-                    for seg_len in range(1, min(4, len(segs) - i) + 1):
-                        w = segs[i:i+seg_len]
-                        if any(not _are_contiguous(w[k], w[k+1]) for k in range(len(w)-1)):
-                            break
-                        task = dag.get_next_task(exam, subj, allow, 0.5*seg_len)
+                    task, window = None, 0
+                    for seg_len in range(1, run_len + 1):
+                        task = memo.next_task(exam, subj, slot_type, allow, 0.5*seg_len)
                         if task:
-                            window = w
+                            window = seg_len
                             break
 
+                if task and block and slot_type != "output" and _holds_rotation(dag, memo, exam, subj, slot_type):
+                    # 整块分配：直到材料完成或时间段用完
+                    count = dag.update_task_steps(task, (segs.hours(j, j) for j in segs.indices_from(i)))
+                    dag.charge(exam, subj, sum(segs.hours(j, j) for j in range(i, i + count)))
+                    for j in range(i, i + count):
+                        if trace is not None and j > i:
+                            trace.checkpoints[j] = (emitted, dag.last_exam_id, dag.last_subject_id)
+                        emitted += 1
+                        yield j + 1, segs.row(j, j, slot_type, task)
+                        if trace is not None:
+                            trace.row_segs.append(j)
+                            trace.row_materials.append(dag.material_key(task))
+                            trace.row_hours.append(segs.hours(j, j))
+                    i += count
+                    consumed = True
+                    break
+
                 if task:        # ← 成功
-                    dag.update_task(task, _slot_hours(window))
-                    plan.append({
-                        "date":  window[0]["date"],
-                        "start": window[0]["start"],
-                        "end":   window[-1]["end"],
-                        "slot_type": slot_type,
-                        "task_id":    task.material_id,
-                        "task_title": task.title,
-                    })
-                    i += len(window)       # 消费子段
+                    hours = segs.hours(i, i + window - 1)
+                    dag.update_task(task, hours)
+                    dag.charge(exam, subj, hours)
+                    emitted += 1
+                    yield i + window, segs.row(i, i + window - 1, slot_type, task)
+                    if trace is not None:
+                        trace.row_segs.append(i)
+                        trace.row_materials.append(dag.material_key(task))
+                        trace.row_hours.append(hours)
+                    i += window            # 消费子段
                     consumed = True
                     break                  # 跳出 shift 循环
 
             if consumed:
                 break                      # 当前 30 min 已分配成功
 
+        if not tried_any:                  # 全部完成
+            return
         if not consumed:
+            memo.empty_slots[slot_key] = (dag.last_exam_id, dag.last_subject_id)
             i += 1                         # 该子段没人用→空置
 
-    return plan
+
+_TASK_TYPE_LABELS = {
+    "passive": "👀📘 输入",
+    "active": "🤔📘 输入",
+    "output": "✍️🧠 输出",
+}
+
+
+def frontend_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """把 plan 中的一行转换为前端结构，见 to_frontend_format。"""
+    start_time = row["start"]  # 已经是 "HH:MM" 格式
+    end_time = row["end"]      # 已经是 "HH:MM" 格式
+
+    # 计算小时数
+    delta_seconds = float((parse_hhmm(end_time) - parse_hhmm(start_time)) * 60)
+    if delta_seconds < 0:
+        delta_seconds += 24 * 3600  # 处理跨午夜情况
+
+    hrs = round(delta_seconds / 3600.0, 2)
+
+    return {
+        "date": row["date"],
+        "start": start_time,
+        "end": end_time,
+        "task_type": _TASK_TYPE_LABELS.get(row["slot_type"], "❓ 未知类型"),
+        "task_name": row["task_title"],
+        "hours_assigned": hrs * 60,
+    }
+
 
 def to_frontend_format(plan: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
@@ -137,41 +449,7 @@ def to_frontend_format(plan: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             "hours_assigned": 2.0
         }
     """
-    type_mapping = {
-        "passive": "👀📘 输入",
-        "active": "🤔📘 输入",
-        "output": "✍️🧠 输出",
-    }
-
-    fmt: List[Dict[str, Any]] = []
-
-    for row in plan:
-        start_time = row["start"]  # 已经是 "HH:MM" 格式
-        end_time = row["end"]      # 已经是 "HH:MM" 格式
-
-        # 计算小时数
-        start_dt = datetime.strptime(start_time, "%H:%M")
-        end_dt = datetime.strptime(end_time, "%H:%M")
-        delta_seconds = (end_dt - start_dt).total_seconds()
-        if delta_seconds < 0:
-            delta_seconds += 24 * 3600  # 处理跨午夜情况
-
-        hrs = round(delta_seconds / 3600.0, 2)
-
-        task_type_label = type_mapping.get(row["slot_type"], "❓ 未知类型")
-
-        fmt.append(
-            {
-                "date": row["date"],
-                "start": start_time,
-                "end": end_time,
-                "task_type": task_type_label,
-                "task_name": row["task_title"],
-                "hours_assigned": hrs * 60,
-            }
-        )
-
-    return fmt
+    return [frontend_row(row) for row in plan]
 
 if __name__ == "__main__":
     # 测试代码
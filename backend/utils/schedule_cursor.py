@@ -0,0 +1,34 @@
+import json
+import secrets
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+# 按需排程的分页游标。续排状态（材料进度变化、轮转游标、虚拟时间、续排位置）随页数增长，
+# 放在 URL 里很快会超过代理的请求头上限，所以存进 ScheduleCursor 表，客户端只拿到一个随机令牌。
+# 写入新游标时顺带清理其他修订号的和超过 CURSOR_TTL 的游标（修订号变了它们也用不上了）。
+CURSOR_TTL = timedelta(days=1)
+TOKEN_BYTES = 12
+
+
+def save_cursor_state(conn: sqlite3.Connection, db_revision: int, state: Dict[str, Any]) -> str:
+    """保存一页排完时的续排状态，返回令牌。"""
+    token = secrets.token_urlsafe(TOKEN_BYTES)
+    now = datetime.now()
+    cursor = conn.cursor()
+    cursor.execute(
+        "DELETE FROM ScheduleCursor WHERE db_revision != ? OR created_at < ?",
+        (db_revision, (now - CURSOR_TTL).isoformat(timespec="seconds")),
+    )
+    cursor.execute(
+        "INSERT INTO ScheduleCursor (token, db_revision, created_at, data) VALUES (?, ?, ?, ?)",
+        (token, db_revision, now.isoformat(timespec="seconds"), json.dumps(state, separators=(",", ":"))),
+    )
+    conn.commit()
+    return token
+
+
+def load_cursor_state(conn: sqlite3.Connection, token: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """(生成时的修订号, 续排状态)；令牌不存在或已被清理时返回 None。"""
+    row = conn.execute("SELECT db_revision, data FROM ScheduleCursor WHERE token = ?", (token,)).fetchone()
+    return (row[0], json.loads(row[1])) if row else None
@@ -0,0 +1,103 @@
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .tree import node_path
+
+# 全文检索（FTS5 trigram，见 init_db.search_schema）。
+# 查询按空白拆成词，词之间为 AND；三个字符及以上的词走 MATCH 并按 bm25 排序，
+# 更短的词（例如两个字的中文词）trigram 索引用不上，回退为 LIKE 子串匹配。
+# trigram 本身就是子串匹配，前缀也能命中；不区分大小写。
+
+MIN_TRIGRAM = 3
+SNIPPET_TOKENS = 16
+
+# 结果分类 -> (FTS 表, 源表, 主键列, 文本列, 额外返回的源表列)
+SEARCH_KINDS: Dict[str, Tuple[str, str, str, str, Tuple[str, ...]]] = {
+    "topics": ("TopicSearch", "TopicNode", "topic_id", "name", ("subject_id", "parent_id")),
+    "input_materials": (
+        "InputMaterialSearch", "InputMaterial", "input_id", "title", ("type", "topic_id", "is_completed")
+    ),
+    "output_materials": (
+        "OutputMaterialSearch", "OutputMaterial", "output_id", "title",
+        ("type", "owner_type", "owner_id", "is_completed"),
+    ),
+    "notes": ("ReviewNoteSearch", "ReviewTaskLog", "id", "notes", ("reviewed_at", "node_type", "node_id")),
+}
+
+
+def _match_expression(terms: Sequence[str]) -> str:
+    # 每个词作为短语加引号，FTS5 的语法字符（* : ^ 等）都按字面匹配
+    return " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _owner_of(kind: str, row: Dict[str, Any]) -> Tuple[str, int]:
+    """结果所属的节点，用来生成路径。"""
+    if kind == "topics":
+        return "topic", row["id"]
+    if kind == "input_materials":
+        return "topic", row["topic_id"]
+    if kind == "output_materials":
+        return row["owner_type"], row["owner_id"]
+    return row["node_type"], row["node_id"]
+
+
+def _search_kind(conn: sqlite3.Connection, kind: str, terms: Sequence[str], limit: int) -> List[Dict[str, Any]]:
+    fts, table, key, column, extra = SEARCH_KINDS[kind]
+    long_terms = [t for t in terms if len(t) >= MIN_TRIGRAM]
+    short_terms = [t for t in terms if len(t) < MIN_TRIGRAM]
+
+    conditions, params = [], []
+    if long_terms:
+        source = f"{fts} f JOIN {table} s ON s.{key} = f.rowid"
+        conditions.append(f"{fts} MATCH ?")
+        params.append(_match_expression(long_terms))
+        text = f"snippet({fts}, 0, '<mark>', '</mark>', '…', {SNIPPET_TOKENS})"
+        order = f"f.rank, s.{key}"
+    else:
+        # 只有短词时用不上索引，直接扫描源表；没有 rank 和 snippet，按 id 排序、返回原文
+        source = f"{table} s"
+        text = f"s.{column}"
+        order = f"s.{key}"
+    for term in short_terms:
+        conditions.append(f"s.{column} LIKE ? ESCAPE '\\'")
+        params.append(_like_pattern(term))
+
+    extra_columns = "".join(f", s.{name}" for name in extra)
+    rows = conn.execute(
+        f"""
+        SELECT s.{key}, s.{column}, {text}{extra_columns}
+        FROM {source}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {order} LIMIT ?
+    """,
+        (*params, limit),
+    ).fetchall()
+    return [{"id": row[0], "text": row[1], "snippet": row[2], **dict(zip(extra, row[3:]))} for row in rows]
+
+
+def search(conn: sqlite3.Connection, query: str, kinds: Optional[Iterable[str]] = None,
+           limit: int = 20) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    在知识点名、输入 / 输出材料标题和复习笔记中检索。
+
+    返回 {分类: [结果]}，每类最多 limit 条，命中 MATCH 的按相关度排序。
+    每条结果带 path：从考试到所属节点的路径，前端不必再拉整棵树。
+    """
+    terms = query.split()
+    kinds = list(SEARCH_KINDS) if kinds is None else list(kinds)
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    paths: Dict[Tuple[str, int], List[Dict[str, Any]]] = {}
+    for kind in kinds:
+        rows = _search_kind(conn, kind, terms, limit) if terms else []
+        for row in rows:
+            owner = _owner_of(kind, row)
+            if owner not in paths:
+                paths[owner] = node_path(conn, *owner)
+            row["path"] = paths[owner]
+        results[kind] = rows
+    return results
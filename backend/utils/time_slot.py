@@ -1,7 +1,101 @@
+from array import array
 from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import date
+from itertools import count
+from typing import Dict, Iterator, Tuple
 import sqlite3
 
+from .availability import MINUTES_PER_DAY, AvailabilityCalendar, mask_runs, range_mask, subtract
+
+# 内部统一用整数分钟：自 1970-01-01 00:00 起的分钟数；只在生成响应时才格式化成字符串
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def parse_day(date_str: str) -> int:
+    """'YYYY-MM-DD' -> 自 1970-01-01 起的天数"""
+    return date.fromisoformat(date_str).toordinal() - _EPOCH_ORDINAL
+
+
+def format_day(day: int) -> str:
+    return date.fromordinal(day + _EPOCH_ORDINAL).isoformat()
+
+
+def parse_hhmm(time_str: str) -> int:
+    """'HH:MM' -> 当天的分钟数（'24:00' 为 1440）"""
+    hour, minute = time_str.split(":")
+    return int(hour) * 60 + int(minute)
+
+
+def format_hhmm(minute_of_day: int) -> str:
+    return f"{minute_of_day // 60:02d}:{minute_of_day % 60:02d}"
+
+
+def round_up_to_slot(start_time):
+    """把 'HH:MM' 向上取整到最近的 30 分钟；23:31 之后得到 '24:00'，即当天已无可用时间。"""
+    total = (parse_hhmm(start_time) + 29) // 30 * 30
+    return format_hhmm(total)
+
+
+def load_availability(conn: sqlite3.Connection) -> AvailabilityCalendar:
+    """把 DefaultSchedule / SpecialSchedule 读成按天的可用时间位图。"""
+    weekday_masks = [0] * 7
+    for dow, start, end in conn.execute("SELECT day_of_week, start_time, end_time FROM DefaultSchedule"):
+        if 0 <= dow < 7:
+            weekday_masks[dow] |= range_mask(parse_hhmm(start), parse_hhmm(end))
+
+    special_masks: Dict[int, int] = defaultdict(int)
+    for date_str, start, end in conn.execute("SELECT date, start_time, end_time FROM SpecialSchedule"):
+        special_masks[parse_day(date_str)] |= range_mask(parse_hhmm(start), parse_hhmm(end))
+    return AvailabilityCalendar(weekday_masks, dict(special_masks))
+
+
+def iter_available_minutes(
+    start_date, end_date=None, db_path="../review_plan.db", start_time=None, not_before=None
+) -> Iterator[Tuple[int, int]]:
+    """
+    逐天惰性产出可用时间段 (start, end)，单位为纪元分钟；调用方可以随时停止。
+    end_date 为 None 时不设上限。重叠或首尾相接的时间段会合并成一段。
+    not_before 为纪元分钟（须落在 start_date 当天），早于它的部分截掉，不取整；用于从游标续排。
+    """
+    with sqlite3.connect(db_path) as conn:
+        calendar = load_availability(conn)
+
+    first_day = parse_day(start_date)
+    days = count(first_day) if end_date is None else range(first_day, parse_day(end_date) + 1)
+    # start_time 只限制 start_date 当天，向上取整到 30 分钟
+    before_start = range_mask(0, (parse_hhmm(start_time) + 29) // 30 * 30) if start_time else 0
+    if not_before is not None and not_before // MINUTES_PER_DAY == first_day:
+        before_start |= range_mask(0, not_before % MINUTES_PER_DAY)
+
+    for day in days:
+        mask = calendar.day_mask(day)
+        if day == first_day:
+            mask = subtract(mask, before_start)
+        base = day * MINUTES_PER_DAY
+        for s, e in mask_runs(mask):
+            yield base + s, base + e
+
+
+def get_available_minutes(
+    start_date, end_date, db_path="../review_plan.db", start_time=None
+) -> Tuple[array, array]:
+    """与 get_available_slots 相同，但返回两个整数数组 (starts, ends)，单位为纪元分钟。"""
+    starts, ends = array("q"), array("q")
+    for s, e in iter_available_minutes(start_date, end_date, db_path, start_time):
+        starts.append(s)
+        ends.append(e)
+    return starts, ends
+
+
+def iter_available_slots(
+    start_date, end_date=None, db_path="../review_plan.db", start_time=None
+) -> Iterator[Dict[str, str]]:
+    """get_available_slots 的惰性版本。"""
+    for s, e in iter_available_minutes(start_date, end_date, db_path, start_time):
+        day = s // MINUTES_PER_DAY
+        base = day * MINUTES_PER_DAY
+        yield {"date": format_day(day), "start": format_hhmm(s - base), "end": format_hhmm(e - base)}
+
 
 def get_available_slots(
     start_date, end_date, db_path="../review_plan.db", start_time=None
@@ -17,57 +111,7 @@ def get_available_slots(
     返回:
         list[dict]: 可用时间段列表
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # 获取默认周计划
-    cursor.execute("SELECT day_of_week, start_time, end_time FROM DefaultSchedule")
-    default_schedule = defaultdict(list)
-    for dow, start, end in cursor.fetchall():
-        default_schedule[dow].append((start, end))
-
-    # 获取特别计划
-    cursor.execute("SELECT date, start_time, end_time FROM SpecialSchedule")
-    special_schedule = defaultdict(list)
-    for date_str, start, end in cursor.fetchall():
-        special_schedule[date_str].append((start, end))
-
-    conn.close()
-
-    result = []
-    date = datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.strptime(end_date, "%Y-%m-%d")
-
-    # 如果有 start_time，解析为datetime.time
-    if start_time:
-        start_time_dt = datetime.strptime(start_time, "%H:%M")
-
-        # 向上取整到最近30分钟
-        minutes = (start_time_dt.minute + 29) // 30 * 30
-        if minutes == 60:
-            start_time_dt = start_time_dt.replace(hour=start_time_dt.hour + 1, minute=0)
-        else:
-            start_time_dt = start_time_dt.replace(minute=minutes)
-        adjusted_start_time_str = start_time_dt.strftime("%H:%M")
-
-    while date <= end:
-        date_str = date.strftime("%Y-%m-%d")
-        if date_str in special_schedule:
-            slots = special_schedule[date_str]
-        else:
-            slots = default_schedule[date.weekday()]
-
-        for s, e in slots:
-            # 只在start_date当天处理start_time限制
-            if start_time and date_str == start_date:
-                if s < adjusted_start_time_str < e:
-                    s = adjusted_start_time_str
-                elif adjusted_start_time_str >= e:
-                    continue  # 这个时间段已经结束了，不用加了
-            result.append({"date": date_str, "start": s, "end": e})
-
-        date += timedelta(days=1)
-    return result
+    return list(iter_available_slots(start_date, end_date, db_path, start_time))
 
 
 if __name__ == "__main__":
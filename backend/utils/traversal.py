@@ -0,0 +1,57 @@
+from typing import Callable, Iterable, Iterator, Sequence, Tuple, TypeVar
+
+# 显式栈的树遍历，DAG 和 API 的树结构共用。
+# 知识点层级可能很深（导入的大纲按章 / 节 / 小节层层嵌套），递归既有逐层的帧开销，也会触到递归深度上限。
+# children(node) 返回子节点序列，遍历按序列顺序进行。
+
+T = TypeVar("T")
+Children = Callable[[T], Sequence[T]]
+
+ENTER = True
+LEAVE = False
+_END = object()
+
+
+def walk(roots: Iterable[T], children: Children) -> Iterator[Tuple[bool, T, int]]:
+    """
+    深度优先产出 (ENTER, 节点, 深度) 与 (LEAVE, 节点, 深度)，与递归遍历的进入 / 离开顺序相同。
+    根节点深度为 0。
+    """
+    # 栈帧：(子节点迭代器, 所属节点, 所属节点深度)；最底下一帧对应 roots，不产出 LEAVE
+    stack = [(iter(roots), None, -1)]
+    while stack:
+        nodes, owner, depth = stack[-1]
+        node = next(nodes, _END)
+        if node is _END:
+            stack.pop()
+            if stack:
+                yield LEAVE, owner, depth
+            continue
+        yield ENTER, node, depth + 1
+        stack.append((iter(children(node)), node, depth + 1))
+
+
+def preorder(roots: Iterable[T], children: Children) -> Iterator[T]:
+    """先根遍历：父节点在子节点之前，兄弟节点按顺序。"""
+    stack = list(roots)
+    stack.reverse()
+    while stack:
+        node = stack.pop()
+        yield node
+        kids = children(node)
+        if kids:
+            stack.extend(reversed(kids))
+
+
+def postorder(roots: Iterable[T], children: Children) -> Iterator[T]:
+    """后根遍历：子节点都产出之后才产出父节点，兄弟节点按顺序。"""
+    stack = [(node, False) for node in reversed(list(roots))]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            yield node
+            continue
+        stack.append((node, True))
+        kids = children(node)
+        if kids:
+            stack.extend((child, False) for child in reversed(kids))
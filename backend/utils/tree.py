@@ -0,0 +1,245 @@
+import json
+import sqlite3
+from collections import defaultdict
+from json.encoder import encode_basestring
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple
+
+from .dag import DAG
+from .traversal import preorder
+
+
+def fetch_topic_forest(conn: sqlite3.Connection) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    一次扫描 TopicNode，在内存中 O(n) 链接成树。
+
+    返回:
+        dict[subject_id, list[dict]]: 每个学科的顶层知识点（按 topic_id 排序），
+        子节点同样按 topic_id 排序放在 "children" 中。
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT topic_id, subject_id, parent_id, name, accuracy, importance, is_leaf
+        FROM TopicNode ORDER BY topic_id
+    """
+    )
+
+    nodes: Dict[int, Dict[str, Any]] = {}
+    links = []
+    for topic_id, subject_id, parent_id, name, accuracy, importance, is_leaf in cursor:
+        node = {
+            "topic_id": topic_id,
+            "name": name,
+            "accuracy": accuracy,
+            "importance": importance,
+            "is_leaf": is_leaf,
+            "children": [],
+        }
+        nodes[topic_id] = node
+        links.append((node, subject_id, parent_id))
+
+    # 按 topic_id 顺序挂接，子节点列表自然有序；父节点不存在的孤儿节点不展示
+    forest: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    for node, subject_id, parent_id in links:
+        if parent_id is None:
+            forest[subject_id].append(node)
+        else:
+            parent = nodes.get(parent_id)
+            if parent is not None:
+                parent["children"].append(node)
+    return forest
+
+
+# ───────────── 子树操作：都基于 TopicClosure，一条集合语句完成，不逐层递归 ─────────────
+# 读取与子树大小成正比；闭包表本身的存储和移动开销是 O(节点数 × 深度)，见 init_db.topic_closure_schema
+_SUBTREE = "SELECT descendant_id FROM TopicClosure WHERE ancestor_id = ?"
+
+
+def subtree_topic_ids(conn: sqlite3.Connection, topic_id: int) -> List[int]:
+    """topic_id 及其全部后代，深的在前；知识点不存在时为空。"""
+    return [
+        row[0]
+        for row in conn.execute(
+            "SELECT descendant_id FROM TopicClosure WHERE ancestor_id = ? ORDER BY depth DESC, descendant_id",
+            (topic_id,),
+        )
+    ]
+
+
+def topic_path(conn: sqlite3.Connection, topic_id: int) -> List[Dict[str, Any]]:
+    """从顶层知识点到 topic_id 的祖先链（含自身）。"""
+    return [
+        {"topic_id": row[0], "name": row[1]}
+        for row in conn.execute(
+            """
+            SELECT t.topic_id, t.name FROM TopicClosure c
+            JOIN TopicNode t ON t.topic_id = c.ancestor_id
+            WHERE c.descendant_id = ? ORDER BY c.depth DESC
+        """,
+            (topic_id,),
+        )
+    ]
+
+
+def node_path(conn: sqlite3.Connection, node_type: str, node_id: int) -> List[Dict[str, Any]]:
+    """从考试到该节点的完整路径：[{"type", "id", "name"}, ...]；节点不存在时为空。"""
+    topics: List[Dict[str, Any]] = []
+    if node_type == "topic":
+        row = conn.execute("SELECT subject_id FROM TopicNode WHERE topic_id = ?", (node_id,)).fetchone()
+        if row is None:
+            return []
+        topics = [{"type": "topic", "id": t["topic_id"], "name": t["name"]} for t in topic_path(conn, node_id)]
+        node_type, node_id = "subject", row[0]
+    if node_type == "subject":
+        row = conn.execute(
+            """
+            SELECT e.exam_id, e.exam_name, s.subject_id, s.subject_name
+            FROM Subject s JOIN Exam e ON e.exam_id = s.exam_id WHERE s.subject_id = ?
+        """,
+            (node_id,),
+        ).fetchone()
+        if row is None:
+            return topics
+        return [{"type": "exam", "id": row[0], "name": row[1]}, {"type": "subject", "id": row[2], "name": row[3]}] + topics
+    row = conn.execute("SELECT exam_id, exam_name FROM Exam WHERE exam_id = ?", (node_id,)).fetchone()
+    return [{"type": "exam", "id": row[0], "name": row[1]}] if row else []
+
+
+def subtree_material_counts(conn: sqlite3.Connection, topic_id: int) -> Dict[str, Dict[str, Any]]:
+    """子树内输入 / 输出材料的数量、已完成数和需要时长。"""
+    counts = {}
+    for kind, sql in (
+        ("input_materials", f"FROM InputMaterial WHERE topic_id IN ({_SUBTREE})"),
+        ("output_materials", f"FROM OutputMaterial WHERE owner_type = 'topic' AND owner_id IN ({_SUBTREE})"),
+    ):
+        total, completed, required_hours = conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(is_completed), 0), COALESCE(SUM(required_hours), 0) {sql}",
+            (topic_id,),
+        ).fetchone()
+        counts[kind] = {"count": total, "completed": completed, "required_hours": required_hours}
+    return counts
+
+
+def delete_topic_subtree(conn: sqlite3.Connection, topic_id: int) -> List[int]:
+    """删除知识点、全部后代及它们的材料，返回被删除的知识点 id（深的在前）；不提交事务。"""
+    topic_ids = subtree_topic_ids(conn, topic_id)
+    if not topic_ids:
+        return topic_ids
+    conn.execute(f"DELETE FROM InputMaterial WHERE topic_id IN ({_SUBTREE})", (topic_id,))
+    conn.execute(f"DELETE FROM OutputMaterial WHERE owner_type = 'topic' AND owner_id IN ({_SUBTREE})", (topic_id,))
+    conn.execute(f"DELETE FROM TopicNode WHERE topic_id IN ({_SUBTREE})", (topic_id,))
+    return topic_ids
+
+
+def is_in_subtree(conn: sqlite3.Connection, root_id: int, topic_id: int) -> bool:
+    """topic_id 是否为 root_id 自身或其后代。"""
+    return conn.execute(
+        "SELECT 1 FROM TopicClosure WHERE ancestor_id = ? AND descendant_id = ?", (root_id, topic_id)
+    ).fetchone() is not None
+
+
+def move_topic_subtree(conn: sqlite3.Connection, topic_id: int, parent_id: Optional[int], subject_id: int):
+    """把整棵子树挂到 parent_id 下（None 为学科顶层）；调用方负责检查不会成环。不提交事务。"""
+    conn.execute("UPDATE TopicNode SET parent_id = ? WHERE topic_id = ?", (parent_id, topic_id))
+    conn.execute(
+        f"UPDATE TopicNode SET subject_id = ? WHERE subject_id != ? AND topic_id IN ({_SUBTREE})",
+        (subject_id, subject_id, topic_id),
+    )
+
+
+def attach_progress(topics: List[Dict[str, Any]], dag: DAG):
+    """给 fetch_topic_forest 产出的每个知识点加上 DAG 中的子树汇总（"progress"）；DAG 里没有的为 None。"""
+    for node in preorder(topics, itemgetter("children")):
+        dag_node = dag.topic_nodes.get(node["topic_id"])
+        node["progress"] = dag_node.progress() if dag_node else None
+
+
+# ───────────── JSON 编码：显式栈，不受嵌套深度限制 ─────────────
+_END = object()
+
+
+def _encode_scalar(value) -> str:
+    if isinstance(value, str):
+        return encode_basestring(value)
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, int):
+        return int.__repr__(value)
+    if isinstance(value, float):
+        if value != value:
+            return "NaN"
+        if value in (float("inf"), float("-inf")):
+            return "Infinity" if value > 0 else "-Infinity"
+        return float.__repr__(value)
+    raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
+
+
+def _encode_key(key) -> str:
+    return encode_basestring(key if isinstance(key, str) else json.dumps(key))
+
+
+def _is_flat(container) -> bool:
+    """容器的元素里没有非空容器，C 编码器最多只递归一层。"""
+    values = container.values() if isinstance(container, dict) else container
+    return not any(isinstance(v, (dict, list, tuple)) and v for v in values)
+
+
+def dumps_deep(obj: Any, indent: Optional[int] = None, separators: Optional[Tuple[str, str]] = None) -> str:
+    """
+    与 json.dumps(obj, ensure_ascii=False, indent=indent, separators=separators) 输出相同，
+    但用显式栈编码，层级再深也不会触到递归深度上限（json 模块和 FastAPI 的默认编码都是递归的）。
+    """
+    if separators is None:
+        separators = (", ", ": ") if indent is None else (",", ": ")
+    item_sep, key_sep = separators
+    # 不缩进时，没有非空容器元素的容器（例如知识点树的叶子）整个交给 C 实现的编码器
+    flat = json.JSONEncoder(ensure_ascii=False, separators=separators).encode if indent is None else None
+    parts: List[str] = []
+    append = parts.append
+    # 栈帧：[元素迭代器, 是否为 dict, 元素前缀（首个元素后换成分隔符）, 分隔符, 结尾, 元素层级]
+    stack: List[list] = []
+    value, level = obj, 0
+    while True:
+        if flat is not None and isinstance(value, (dict, list, tuple)) and _is_flat(value):
+            append(flat(value))
+        elif isinstance(value, (dict, list, tuple)) and value:
+            is_dict = isinstance(value, dict)
+            opener, closer = ("{", "}") if is_dict else ("[", "]")
+            if indent is None:
+                prefix, sep = opener, item_sep
+            else:
+                pad = "\n" + " " * (indent * (level + 1))
+                prefix, sep = opener + pad, item_sep + pad
+                closer = "\n" + " " * (indent * level) + closer
+            stack.append([iter(value.items() if is_dict else value), is_dict, prefix, sep, closer, level + 1])
+        elif isinstance(value, dict):
+            append("{}")
+        elif isinstance(value, (list, tuple)):
+            append("[]")
+        else:
+            append(_encode_scalar(value))
+
+        # 找下一个要编码的元素；容器里的元素都编码完了就补上结尾
+        while stack:
+            frame = stack[-1]
+            item = next(frame[0], _END)
+            if item is _END:
+                append(frame[4])
+                stack.pop()
+                continue
+            append(frame[2])
+            frame[2] = frame[3]
+            if frame[1]:
+                key, value = item
+                append(_encode_key(key) + key_sep)
+            else:
+                value = item
+            level = frame[5]
+            break
+        else:
+            return "".join(parts)
@@ -1,7 +1,9 @@
 from sqlite3 import connect
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, Any, List
 
+from .review_stats import current_streak
+
 
 def build_user_context(DB_NAME) -> Dict[str, Any]:
     context = {
@@ -16,29 +18,13 @@ def build_user_context(DB_NAME) -> Dict[str, Any]:
     with connect(DB_NAME) as conn:
         cursor = conn.cursor()
 
-        # --- 1. 获取近7天打卡记录，计算 streak ---
-        cursor.execute(
-            """
-            SELECT DISTINCT reviewed_at FROM ReviewTaskLog
-            WHERE node_type = 'topic' AND duration_minutes > 0
-            ORDER BY reviewed_at DESC
-            LIMIT 7
-        """
-        )
-        dates = [datetime.strptime(r[0], "%Y-%m-%d").date() for r in cursor.fetchall()]
-
-        streak = 0
-        for i in range(7):
-            if today - timedelta(days=i) in dates:
-                streak += 1
-            else:
-                break
-        context["current_streak"] = streak
+        # --- 1. 连续打卡天数（读每日汇总，不再限于近 7 天） ---
+        context["current_streak"] = current_streak(conn, today)
 
         # --- 2. 累计复习时间 ---
         cursor.execute(
             """
-            SELECT SUM(duration_minutes) FROM ReviewTaskLog
+            SELECT SUM(minutes) FROM ReviewDailyStats
         """
         )
         total_minutes = cursor.fetchone()[0]
@@ -15,13 +15,26 @@ type ReviewTask = {
   output_material_title?: string | null;
 };
 
+// 每页条数；下一页的 cursor 由后端放在 X-Next-Cursor 响应头里
+const PAGE_SIZE = 100;
+
 export default function ReviewLogPage() {
   const [logs, setLogs] = useState<ReviewTask[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+
+  const loadPage = (cursor: string | null) => {
+    const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+    if (cursor) params.set('cursor', cursor);
+    fetch(`/api/review-tasks?${params}`)
+      .then(res => {
+        setNextCursor(res.headers.get('X-Next-Cursor'));
+        return res.json();
+      })
+      .then((page: ReviewTask[]) => setLogs(prev => (cursor ? [...prev, ...page] : page)));
+  };
 
   useEffect(() => {
-    fetch('/api/review-tasks')
-      .then(res => res.json())
-      .then(setLogs);
+    loadPage(null);
   }, []);
 
   return (
@@ -55,6 +68,14 @@ export default function ReviewLogPage() {
           ))}
         </tbody>
       </table>
+      {nextCursor && (
+        <button
+          className="mt-4 px-4 py-2 border rounded hover:bg-gray-100"
+          onClick={() => loadPage(nextCursor)}
+        >
+          加载更多
+        </button>
+      )}
     </div>
   );
 }
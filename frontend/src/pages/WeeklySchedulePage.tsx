@@ -41,15 +41,26 @@ export type Task = {
 
 export default function WeeklySchedulePage() {
   const [schedule, setSchedule] = useState<Task[]>([]);
+  const [futureLoaded, setFutureLoaded] = useState(false);
 
-  // 拉取任务
+  // 先只拉取本周的任务；后面几个月的计划按需加载
   useEffect(() => {
-    fetch("/api/schedule")
+    fetch("/api/schedule?days=7")
       .then((res) => res.json())
       .then((data) => setSchedule(data.schedule ?? []))
       .catch(() => setSchedule([]));
   }, []);
 
+  const loadFuture = () => {
+    fetch("/api/schedule")
+      .then((res) => res.json())
+      .then((data) => {
+        setSchedule(data.schedule ?? []);
+        setFutureLoaded(true);
+      })
+      .catch(() => {});
+  };
+
   // 今天开始连续 7 天的日期
   const today = new Date();
   const next7Dates = Array.from({ length: 7 }, (_, i) => {
@@ -130,6 +141,14 @@ export default function WeeklySchedulePage() {
 
       {/* 未来任务列表 */}
       <h2 className="text-xl font-bold my-4">📋 未来任务</h2>
+      {!futureLoaded && (
+        <button
+          className="mb-4 px-4 py-2 border rounded hover:bg-gray-100"
+          onClick={loadFuture}
+        >
+          加载未来任务
+        </button>
+      )}
       <div className="overflow-auto shadow-sm">
         <table className="w-full border text-sm">
           <thead className="bg-gray-100">